@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+'''
+Copyright (c) 2011-2012 Doug Thompson
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be included
+in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+
+'''
+A local cache of built EPUB files, keyed by EpubBook.getBuildKey
+'''
+
+import os
+import shutil
+
+class EpubCache:
+    '''
+    A folder of previously built EPUB files, each named by the hash of
+    everything it was built from
+
+    Every hit marks the file as recently used, and the least recently used
+    files are removed whenever the cache grows past maxSize bytes.  Several
+    processes can share one cache folder.
+    '''
+    def __init__(self, cacheDir, maxSize=1024 * 1024 * 1024):
+        self.cacheDir = cacheDir
+        self.maxSize = maxSize
+        if not os.path.isdir(cacheDir):
+            try:
+                os.makedirs(cacheDir)
+            except OSError:
+                # Another process got there first
+                if not os.path.isdir(cacheDir):
+                    raise
+
+    def getPath(self, key):
+        return os.path.join(self.cacheDir, key + '.epub')
+
+    def fetch(self, key, epubFile):
+        '''
+        Copy the cached EPUB for a key to epubFile, returning False on a miss
+        '''
+        path = self.getPath(key)
+        try:
+            shutil.copyfile(path, epubFile)
+        except IOError:
+            return False
+
+        # The modified time is what the eviction goes by
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, key, epubFile):
+        '''
+        Add a newly built EPUB to the cache, then trim the cache to size
+        '''
+        path = self.getPath(key)
+        tempFile = '{0}.{1}.tmp'.format(path, os.getpid())
+        shutil.copyfile(epubFile, tempFile)
+        try:
+            if os.path.isfile(path):
+                os.remove(path)
+            os.rename(tempFile, path)
+        except OSError:
+            # Stored by another process at the same time
+            os.remove(tempFile)
+
+        self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used EPUB files until the cache fits
+        '''
+        entries = []
+        total = 0
+        for name in os.listdir(self.cacheDir):
+            if not name.endswith('.epub'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cacheDir, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(os.path.join(self.cacheDir, name))
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,702 @@
+#!/usr/bin/env python
+'''
+Copyright (c) 2011-2012 Doug Thompson
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be included
+in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+
+'''
+A library of EPUB books, kept sorted by author and title and published as
+paginated OPDS feeds
+
+Usage:
+    python EpubLibrary.py [-w WORKERS] [-r] [--no-covers] <library.atom> <directory> ...
+'''
+
+import os
+import re
+import sys
+import json
+import bisect
+import hashlib
+import itertools
+import posixpath
+import argparse
+import traceback
+import multiprocessing
+
+from time import strftime, gmtime
+from cStringIO import StringIO
+from EpubTools import EpubBook, EpubProcessor, getTemplate, ET
+
+# PIL is optional: without it the cover is copied as it is and the
+# thumbnail is the same full size image
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# The templates in support/ are loaded relative to the application directory
+appDir = os.path.dirname(os.path.abspath(__file__))
+
+atomNs = '{http://www.w3.org/2005/Atom}'
+xhtmlNs = '{http://www.w3.org/1999/xhtml}'
+
+acquisitionType = 'application/atom+xml;profile=opds-catalog;kind=acquisition'
+navigationType = 'application/atom+xml;profile=opds-catalog;kind=navigation'
+
+# The book details kept for each entry
+entryFields = ['identifier', 'title', 'creator', 'author', 'published', 'language',
+               'subject', 'description', 'updated', 'authorHash', 'titleHash', 'source']
+
+# Largest size (width, height) of the cover thumbnails
+thumbnailSize = (120, 180)
+
+def getTimestamp():
+    '''
+    Get the current time as an ATOM date
+    '''
+    return strftime('%Y-%m-%dT%H:%M:%SZ', gmtime())
+
+def getShortHash(text):
+    # Book details read from XML can be unicode
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return EpubProcessor.getShortHash(text)
+
+def makeEntry(epub):
+    '''
+    Get the library entry for an EpubBook (see EpubProcessor.getEpubDetails
+    and EpubProcessor.readEpubMetadata)
+    '''
+    return {
+        'identifier': epub.identifier,
+        'title': epub.title,
+        'creator': epub.creator,
+        'author': epub.author,
+        'published': epub.origPublishDate,
+        'language': epub.language,
+        'subject': epub.subject,
+        'description': epub.description,
+        'updated': getTimestamp(),
+        'authorHash': getShortHash(epub.creator),
+        'titleHash': getShortHash(epub.title),
+        'source': os.path.abspath(epub.fileName),
+    }
+
+def toUnicode(value):
+    # Entries read back from the index are unicode, new ones can be UTF-8
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    return value
+
+def isSameEntry(entry, other):
+    '''
+    Check two entries describe the book the same way, apart from when they
+    were updated
+    '''
+    for field in entry:
+        if field <> 'updated' and toUnicode(entry[field]) <> toUnicode(other.get(field)):
+            return False
+    return len(entry) == len(other)
+
+def getKey(entry):
+    '''
+    Get the sort key of a library entry
+    '''
+    # Unicode, so new entries sort the same way as those from the index
+    return (toUnicode(entry['creator']), toUnicode(entry['title']))
+
+def getNavKey(item):
+    '''
+    Get the sort key of a navigation feed entry (an author or a subject)
+    '''
+    return (toUnicode(item['title']),)
+
+def getPageHref(name, start):
+    '''
+    Get the file name of the page of a feed starting at a sort key.  The
+    first page is always name-1.atom, as the other feeds link to it.
+    '''
+    if start is None:
+        return '{0}-1.atom'.format(name)
+    return '{0}-{1}.atom'.format(name, getShortHash(json.dumps(start)))
+
+def splitPages(keys, starts, pageSize):
+    '''
+    Split the sorted keys of a feed's items into pages at the start keys
+    the pages had before, so a book added or removed only changes the page
+    it sorts into.  A page grown past pageSize is split evenly, an empty
+    one is dropped and one left small is joined to the page before it.
+    Returns [(start key, begin, end)] with the first start key None.
+    '''
+    bounds = [0] + [bisect.bisect_left(keys, start) for start in starts[1:]] + [len(keys)]
+    buckets = [None] + list(starts[1:])
+    pages = []
+    for i in xrange(len(buckets)):
+        begin, end = bounds[i], bounds[i + 1]
+        if begin == end:
+            continue
+        if len(pages) > 0 and end - pages[-1][1] <= pageSize // 2:
+            pages[-1] = (pages[-1][0], pages[-1][1], end)
+            continue
+
+        count = (end - begin + pageSize - 1) // pageSize
+        for j in xrange(count):
+            first = begin + j * (end - begin) // count
+            last = begin + (j + 1) * (end - begin) // count
+            pages.append((buckets[i] if j == 0 else keys[first], first, last))
+
+    if len(pages) == 0:
+        return [(None, 0, 0)]
+    pages[0] = (None, pages[0][1], pages[0][2])
+    return pages
+
+def getUpdated(items):
+    '''
+    Get the latest updated time of feed entries, so a feed only changes
+    when its entries do
+    '''
+    return max([item['updated'] for item in items] or ['1970-01-01T00:00:00Z'])
+
+def makeNavEntry(entryId, title, href, entries):
+    '''
+    Get a navigation feed entry linking to the feed of some books
+    '''
+    return {
+        'id': entryId,
+        'title': title,
+        'href': href,
+        'content': '{0} book(s)'.format(len(entries)),
+        'updated': getUpdated(entries),
+    }
+
+def readCover(source):
+    '''
+    Read the cover image of a book from its EPUB file (the OPF cover) or its
+    HTML file (the cover createEpub would use), or None without one
+    '''
+    if os.path.splitext(source)[1].lower() == '.epub':
+        return EpubProcessor.readEpubCover(source)
+
+    book = EpubBook(source)
+    book.findCoverImage(source, book.parseFileName(source))
+    if book.coverImageSource == '':
+        return None
+    with open(book.coverImageSource, 'rb') as f:
+        return f.read()
+
+def writeCover(data, coverFile, thumbFile, size):
+    '''
+    Write the full size JPEG cover and its thumbnail from the cover data
+    '''
+    if Image is None:
+        replaceFile(coverFile, data)
+        replaceFile(thumbFile, data)
+        return
+
+    image = Image.open(StringIO(data))
+    if image.format == 'JPEG':
+        # Already a JPEG, so keep it as it is
+        replaceFile(coverFile, data)
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if image.format <> 'JPEG':
+        out = StringIO()
+        image.save(out, 'JPEG', quality=90)
+        replaceFile(coverFile, out.getvalue())
+
+    image.thumbnail(size, Image.ANTIALIAS)
+    out = StringIO()
+    image.save(out, 'JPEG', quality=85)
+    replaceFile(thumbFile, out.getvalue())
+
+def _coverJob(job):
+    # Returns (key, cover hash, written, error); run in a worker process
+    key, source, coverFile, thumbFile, size, coverHash = job
+    try:
+        data = readCover(source)
+        if data is None:
+            return key, None, False, ''
+        newHash = hashlib.sha1(data).hexdigest()
+        # The source changed, but maybe not its cover
+        if newHash == coverHash and os.path.isfile(coverFile) and os.path.isfile(thumbFile):
+            return key, newHash, False, ''
+        writeCover(data, coverFile, thumbFile, size)
+        return key, newHash, True, ''
+    except Exception:
+        return key, coverHash, False, traceback.format_exc()
+
+def replaceFile(path, data):
+    '''
+    Write a file, only replacing the existing file once the new one is
+    complete
+    '''
+    dirName = os.path.dirname(path)
+    if dirName <> '' and not os.path.isdir(dirName):
+        os.makedirs(dirName)
+
+    # Per process, as the cover workers can write at the same time
+    tempFile = '{0}.{1}.tmp'.format(path, os.getpid())
+    try:
+        with open(tempFile, 'wb') as f:
+            f.write(data)
+        # Only Windows cannot rename over an existing file; elsewhere the
+        # file is replaced in one step, so there is always a whole copy
+        if os.name == 'nt' and os.path.isfile(path):
+            os.remove(path)
+        os.rename(tempFile, path)
+    except:
+        if os.path.isfile(tempFile):
+            os.remove(tempFile)
+        raise
+
+class EpubLibrary:
+    '''
+    The books of a library, sorted by (creator, title)
+
+    Entries are kept in an index next to the feed (libraryFile + '.json')
+    so the feeds never have to be read back in.  Adding a book only takes a
+    binary search, and the feeds are regenerated once by save() however
+    many books were added.  A feed without an index has its entries
+    imported.
+
+    libraryFile is the root OPDS navigation feed.  It links to the feeds
+    of all books, of each author and of each subject, which are written in
+    pages of up to pageSize entries to the folder of the same name (so
+    library.atom is next to library/).  Pages cover a range of sort keys
+    rather than an offset, so adding a book only changes the page it sorts
+    into (see splitPages), and save() only renders the pages of the books
+    added or removed since the last save.
+    '''
+    def __init__(self, libraryFile, pageSize=50):
+        self.libraryFile = libraryFile
+        self.indexFile = libraryFile + '.json'
+        self.feedDir = os.path.splitext(libraryFile)[0]
+        self.pageSize = pageSize
+        self.title = 'EPUB Studio Library'
+        self.id = 'urn:uuid:' + getShortHash(os.path.abspath(libraryFile))
+        # Parallel lists: the sort keys and their entries
+        self.keys = []
+        self.entries = []
+        # Feed file (relative to the library folder) -> hash of its inputs
+        self.shards = {}
+        # Feed name -> the start sort key of each of its pages
+        self.pages = {}
+        # Feed name -> sort keys of the items added or removed since the
+        # last save()
+        self.changed = {}
+        # authorHash/titleHash -> [(mtime, size) of the source, hash of the
+        # cover] of the cover images already written
+        self.covers = {}
+        # Number of feed files written by the last save()
+        self.written = 0
+        self.load()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self):
+        '''
+        Read the index, or the entries of an existing feed
+        '''
+        self.keys = []
+        self.entries = []
+        self.shards = {}
+        self.pages = {}
+        self.changed = {}
+        self.covers = {}
+        if os.path.isfile(self.indexFile):
+            with open(self.indexFile, 'r') as f:
+                index = json.load(f)
+            self.entries = index['entries']
+            self.shards = index['shards']
+            self.covers = index.get('covers', {})
+            # Without the page start keys every page is written once again
+            for name, starts in index.get('pages', {}).items():
+                self.pages[name] = [tuple(start) if start is not None else None for start in starts]
+            self.entries.sort(key=getKey)
+            self.keys = [getKey(entry) for entry in self.entries]
+        else:
+            # A single feed from an older version, or the pages of all books
+            feedFiles = [self.libraryFile]
+            page = 1
+            while os.path.isfile(os.path.join(self.feedDir, 'all-{0}.atom'.format(page))):
+                feedFiles.append(os.path.join(self.feedDir, 'all-{0}.atom'.format(page)))
+                page += 1
+            for feedFile in feedFiles:
+                if os.path.isfile(feedFile):
+                    self.importFeed(feedFile)
+
+    def importFeed(self, feedFile):
+        '''
+        Add the entries of an ATOM feed written by an older version
+        '''
+        for event, elem in ET.iterparse(feedFile):
+            if elem.tag <> atomNs + 'entry':
+                continue
+
+            entry = dict((field, '') for field in entryFields)
+            entry['identifier'] = elem.findtext(atomNs + 'id', '')
+            entry['title'] = elem.findtext(atomNs + 'title', '')
+            entry['creator'] = elem.findtext(atomNs + 'author/' + atomNs + 'name', '')
+            entry['author'] = entry['creator']
+            entry['description'] = elem.findtext(atomNs + 'summary', '')
+            entry['updated'] = elem.findtext(atomNs + 'updated', '')
+
+            details = elem.findtext(atomNs + 'content/' + xhtmlNs + 'div', '')
+            match = re.match(r'Published: (.*), Language: (.*), Subject: (.*)', details.strip())
+            if match is not None:
+                entry['published'], entry['language'], entry['subject'] = match.groups()
+
+            isBook = False
+            for link in elem.findall(atomNs + 'link'):
+                if link.get('type') == 'application/epub+zip':
+                    isBook = True
+                    href = link.get('href', '')
+                    entry['authorHash'] = posixpath.basename(posixpath.dirname(href))
+                    entry['titleHash'] = os.path.splitext(href.split('/')[-1])[0]
+
+            # Navigation entries do not link to a book
+            if isBook:
+                self.add(entry)
+            elem.clear()
+
+    def find(self, creator, title):
+        '''
+        Get the entry of a book, or None when it is not in the library
+        '''
+        key = (toUnicode(creator), toUnicode(title))
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.entries[i]
+        return None
+
+    def add(self, entry):
+        '''
+        Add a library entry, replacing the entry of the same book
+
+        An unchanged book keeps its updated time, so adding it again does
+        not make its feeds be written again.
+        '''
+        key = getKey(entry)
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            if isSameEntry(entry, self.entries[i]):
+                return
+            self.touch(self.entries[i])
+            self.entries[i] = entry
+        else:
+            self.keys.insert(i, key)
+            self.entries.insert(i, entry)
+        self.touch(entry)
+
+    def remove(self, creator, title):
+        '''
+        Remove a book, returning False when it is not in the library
+        '''
+        key = (toUnicode(creator), toUnicode(title))
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            self.touch(self.entries[i])
+            del self.keys[i]
+            del self.entries[i]
+            return True
+        return False
+
+    def touch(self, entry):
+        '''
+        Note the feeds an entry is in, so save() writes the pages it sorts
+        into
+        '''
+        key = getKey(entry)
+        feeds = [('all', key), ('author-' + entry['authorHash'], key), ('authors', key[:1])]
+        for subject in entry['subject'].split(','):
+            subject = subject.strip()
+            if subject <> '':
+                feeds.append(('subject-' + getShortHash(subject), key))
+                feeds.append(('subjects', (toUnicode(subject),)))
+        for name, itemKey in feeds:
+            self.changed.setdefault(name, set()).add(itemKey)
+
+    def addBook(self, epub):
+        '''
+        Add (or replace) the entry of an EpubBook
+        '''
+        self.add(makeEntry(epub))
+
+    def addBooks(self, epubs):
+        '''
+        Add (or replace) the entries of several EpubBooks
+        '''
+        for epub in epubs:
+            self.addBook(epub)
+
+    def save(self):
+        '''
+        Write the index and the feeds that have changed
+        '''
+        shards = {}
+        pages = {}
+        self.written = 0
+        feedName = os.path.basename(self.feedDir)
+        rootName = os.path.basename(self.libraryFile)
+
+        # The root navigation feed
+        root = [makeNavEntry(self.id + ':all', 'All Books', feedName + '/all-1.atom', self.entries)]
+        feeds = [('all', 'All Books', 'acquisition', self.entries)]
+
+        # Each author's books, which are next to each other in the sort order
+        authors = []
+        for creator, group in itertools.groupby(self.entries, lambda entry: entry['creator']):
+            entries = list(group)
+            name = 'author-' + entries[0]['authorHash']
+            feeds.append((name, creator, 'acquisition', entries))
+            authors.append(makeNavEntry(self.id + ':' + name, creator, name + '-1.atom', entries))
+        feeds.append(('authors', 'By Author', 'navigation', authors))
+        root.append(makeNavEntry(self.id + ':authors', 'By Author', feedName + '/authors-1.atom', self.entries))
+
+        # Each subject's books, in the same order
+        subjects = {}
+        for entry in self.entries:
+            for subject in entry['subject'].split(','):
+                subject = subject.strip()
+                if subject <> '':
+                    subjects.setdefault(subject, []).append(entry)
+        subjectNav = []
+        for subject in sorted(subjects, key=toUnicode):
+            name = 'subject-' + getShortHash(subject)
+            feeds.append((name, subject, 'acquisition', subjects[subject]))
+            subjectNav.append(makeNavEntry(self.id + ':' + name, subject, name + '-1.atom', subjects[subject]))
+        feeds.append(('subjects', 'By Subject', 'navigation', subjectNav))
+        root.append(makeNavEntry(self.id + ':subjects', 'By Subject', feedName + '/subjects-1.atom', self.entries))
+
+        for name, title, kind, items in feeds:
+            self.writePages(name, title, kind, items, shards, pages)
+
+        feed = {'id': self.id, 'title': self.title, 'updated': getUpdated(root), 'base': '',
+                'links': [('self', rootName, navigationType), ('start', rootName, navigationType)]}
+        self.writeShard(rootName, 'library-nav.atom', feed, root, shards)
+
+        # Remove the pages of authors and subjects that have gone, and any
+        # pages past the end of a feed that has shrunk
+        for shard in self.shards:
+            if shard not in shards:
+                path = os.path.join(os.path.dirname(self.libraryFile), *shard.split('/'))
+                if os.path.isfile(path):
+                    os.remove(path)
+
+        self.shards = shards
+        self.pages = pages
+        self.changed = {}
+        replaceFile(self.indexFile, json.dumps({'entries': self.entries, 'shards': self.shards, 'pages': self.pages,
+                                                'covers': self.covers}))
+
+    def updateCovers(self, workers=None, size=thumbnailSize):
+        '''
+        Write the cover image and thumbnail of each book (as
+        authorHash/titleHash.jpg and authorHash/titleHash_tn.jpg next to the
+        library file) across a pool of processes
+
+        Books whose source file has not changed since are skipped without
+        being opened.  Returns (number of books written, [(source, error)]).
+        '''
+        libraryDir = os.path.dirname(self.libraryFile)
+        keys = set(entry['authorHash'] + '/' + entry['titleHash'] for entry in self.entries)
+        for key in self.covers.keys():
+            if key not in keys:
+                del self.covers[key]
+
+        jobs = []
+        stamps = {}
+        for entry in self.entries:
+            source = entry.get('source', '')
+            if source == '' or not os.path.isfile(source):
+                continue
+            key = entry['authorHash'] + '/' + entry['titleHash']
+            coverFile = os.path.join(libraryDir, entry['authorHash'], entry['titleHash'] + '.jpg')
+            thumbFile = os.path.join(libraryDir, entry['authorHash'], entry['titleHash'] + '_tn.jpg')
+            st = os.stat(source)
+            stamp = [st.st_mtime, st.st_size]
+
+            coverHash = None
+            if key in self.covers:
+                coverStamp, coverHash = self.covers[key]
+                if coverStamp == stamp and (coverHash is None or (os.path.isfile(coverFile) and os.path.isfile(thumbFile))):
+                    continue
+            stamps[key] = (source, stamp)
+            jobs.append((key, source, coverFile, thumbFile, size, coverHash))
+
+        written = 0
+        errors = []
+        if len(jobs) == 0:
+            return written, errors
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(max(1, min(workers, len(jobs))))
+        try:
+            for key, coverHash, wrote, error in pool.imap_unordered(_coverJob, jobs, 8):
+                source, stamp = stamps[key]
+                if error <> '':
+                    errors.append((source, error))
+                    continue
+                self.covers[key] = [stamp, coverHash]
+                if wrote:
+                    written += 1
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+        return written, errors
+
+    def writePages(self, name, title, kind, items, shards, pages):
+        '''
+        Write a feed in pages of up to pageSize items, linked first/prev/next
+
+        There is no last link, as a new last page would change every page.
+        A page is only rendered when one of its items or its prev/next pages
+        changed since the last save(); the others keep their hashes.
+        '''
+        feedName = os.path.basename(self.feedDir)
+        rootHref = '../' + os.path.basename(self.libraryFile)
+
+        # Nothing in the feed changed, so its pages are the same as they were
+        if name not in self.changed and name in self.pages:
+            hrefs = [getPageHref(name, start) for start in self.pages[name]]
+            if all(feedName + '/' + href in self.shards and os.path.isfile(os.path.join(self.feedDir, href))
+                   for href in hrefs):
+                pages[name] = self.pages[name]
+                for href in hrefs:
+                    shards[feedName + '/' + href] = self.shards[feedName + '/' + href]
+                return
+
+        if kind == 'acquisition':
+            template = 'library.atom'
+            feedType = acquisitionType
+            # The keys of all the books are already to hand
+            keys = self.keys if items is self.entries else [getKey(item) for item in items]
+        else:
+            template = 'library-nav.atom'
+            feedType = navigationType
+            keys = [getNavKey(item) for item in items]
+
+        # The prev/next pages of each page at the last save
+        oldHrefs = [None] + [getPageHref(name, start) for start in self.pages.get(name, [])] + [None]
+        oldLinks = dict((oldHrefs[i], (oldHrefs[i - 1], oldHrefs[i + 1])) for i in xrange(1, len(oldHrefs) - 1))
+        changed = sorted(self.changed.get(name, []))
+
+        layout = splitPages(keys, self.pages.get(name, []), self.pageSize)
+        pages[name] = [start for start, begin, end in layout]
+        hrefs = [None] + [getPageHref(name, start) for start in pages[name]] + [None]
+        for i, (start, begin, end) in enumerate(layout):
+            href = hrefs[i + 1]
+            shard = feedName + '/' + href
+            path = os.path.join(self.feedDir, href)
+
+            # Whether a book added or removed sorts between this page's
+            # start and the next page's
+            low = 0 if start is None else bisect.bisect_left(changed, start)
+            high = len(changed) if i + 1 == len(layout) else bisect.bisect_left(changed, layout[i + 1][0])
+            if (high == low and oldLinks.get(href) == (hrefs[i], hrefs[i + 2]) and
+                    shard in self.shards and os.path.isfile(path)):
+                shards[shard] = self.shards[shard]
+                continue
+
+            pageItems = items[begin:end]
+            links = [('self', href, feedType),
+                     ('start', rootHref, navigationType),
+                     ('up', rootHref, navigationType),
+                     ('first', hrefs[1], feedType)]
+            if hrefs[i] is not None:
+                links.append(('prev', hrefs[i], feedType))
+            if hrefs[i + 2] is not None:
+                links.append(('next', hrefs[i + 2], feedType))
+            feed = {'id': '{0}:{1}'.format(self.id, name), 'title': title, 'updated': getUpdated(pageItems),
+                    'base': '../', 'links': links}
+            self.writeShard(shard, template, feed, pageItems, shards)
+
+    def writeShard(self, shard, template, feed, items, shards):
+        '''
+        Render one feed file, unless it was written from the same inputs
+        '''
+        # Sorted by hand, json only uses its C encoder without sort_keys
+        inputs = [template, sorted(feed.items()), [sorted(item.items()) for item in items]]
+        inputsHash = hashlib.sha1(json.dumps(inputs)).hexdigest()
+        shards[shard] = inputsHash
+        path = os.path.join(os.path.dirname(self.libraryFile), *shard.split('/'))
+        if self.shards.get(shard) == inputsHash and os.path.isfile(path):
+            return
+
+        replaceFile(path, self.renderFeed(template, feed, items))
+        self.written += 1
+
+    def renderFeed(self, template, feed, items):
+        '''
+        Render a feed from a template
+        '''
+        return getTemplate(template).render_unicode(feed=feed, entries=items).encode('utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description='Add EPUB files to a library feed.')
+    parser.add_argument('library', help='the ATOM feed of the library')
+    parser.add_argument('sources', nargs='+', help='directories of EPUB files')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes (default: one per CPU)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='search directories recursively')
+    parser.add_argument('--no-covers', action='store_true', help='do not write the cover images and thumbnails')
+    args = parser.parse_args()
+
+    libraryFile = os.path.abspath(args.library)
+    sources = [os.path.abspath(source) for source in args.sources]
+    os.chdir(appDir)
+
+    library = EpubLibrary(libraryFile)
+    added = 0
+    failures = 0
+    for source in sources:
+        for fileName, epub, error in EpubProcessor.scanEpubs(source, args.workers, args.recursive):
+            if error == '':
+                library.addBook(epub)
+                added += 1
+            else:
+                failures += 1
+                print 'FAILED {0}'.format(fileName)
+                sys.stderr.write(error)
+
+    if not args.no_covers:
+        written, errors = library.updateCovers(args.workers)
+        for source, error in errors:
+            failures += 1
+            print 'FAILED cover {0}'.format(source)
+            sys.stderr.write(error)
+        print '{0} cover(s) written'.format(written)
+
+    library.save()
+    print '{0} book(s) added, {1} failed, {2} in the library, {3} feed file(s) written'.format(added, failures, len(library), library.written)
+
+    if failures > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
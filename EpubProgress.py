@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+'''
+Copyright (c) 2011-2012 Doug Thompson
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be included
+in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+import time
+import logging
+import threading
+
+class OperationCancelled(Exception):
+    '''
+    Raised from a progress event when the user has cancelled the operation
+    '''
+    pass
+
+class ProgressSink:
+    '''
+    Receives progress events from the EPUB classes and ignores them all
+
+    Subclass and override the events of interest.
+    '''
+    def status(self, text):
+        '''
+        A general status message
+        '''
+        pass
+
+    def chapterFound(self, chapter):
+        '''
+        The HTML splitter found a chapter heading
+        '''
+        pass
+
+    def chapterWritten(self, chapter, count):
+        '''
+        A chapter file has been written (count so far)
+        '''
+        pass
+
+    def imagesFound(self, names):
+        '''
+        The list of image file names in the EPUB has changed
+        '''
+        pass
+
+    def done(self, text='Done.'):
+        '''
+        The current operation has finished
+        '''
+        self.status(text)
+
+class WxProgressSink(ProgressSink):
+    '''
+    Show progress on a wx status bar and cover image combo box
+
+    Status updates are throttled to one every interval seconds so large
+    books are not slowed down by redrawing the status bar for each chapter.
+    When the events come from another thread, pass wx.CallAfter as
+    callAfter so the widgets are only touched on the GUI thread.  Without
+    an imageCombo the image names are only kept in self.images.
+
+    Calling cancel() makes the next event raise OperationCancelled in the
+    thread doing the work.
+    '''
+    def __init__(self, statusBar, imageCombo, interval=0.2, callAfter=None):
+        self.statusBar = statusBar
+        self.imageCombo = imageCombo
+        self.interval = interval
+        self.callAfter = callAfter
+        self.lastUpdate = 0
+        self.images = []
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def reset(self):
+        self.cancelled.clear()
+        self.lastUpdate = 0
+
+    def checkCancelled(self):
+        if self.cancelled.is_set():
+            raise OperationCancelled()
+
+    def call(self, func, *args):
+        if self.callAfter is None:
+            func(*args)
+        else:
+            self.callAfter(func, *args)
+
+    def setStatus(self, text):
+        self.lastUpdate = time.time()
+        self.call(self.statusBar.SetStatusText, text)
+
+    def setImages(self, names):
+        self.imageCombo.Clear()
+        for name in names:
+            self.imageCombo.Append(name)
+
+    def status(self, text):
+        self.checkCancelled()
+        if time.time() - self.lastUpdate >= self.interval:
+            self.setStatus(text)
+
+    def chapterFound(self, chapter):
+        self.status('Found chapter: ' + chapter.id)
+
+    def chapterWritten(self, chapter, count):
+        self.status('Creating Chapter file: ' + chapter.name)
+
+    def imagesFound(self, names):
+        self.checkCancelled()
+        self.images = list(names)
+        if self.imageCombo is not None:
+            self.call(self.setImages, self.images)
+
+    def done(self, text='Done.'):
+        # Always show the final message
+        self.setStatus(text)
+
+class LogProgressSink(ProgressSink):
+    '''
+    Write progress events to a logger as key=value records
+    '''
+    def __init__(self, logger=None):
+        if logger is None:
+            logger = logging.getLogger('EpubStudio')
+        self.logger = logger
+
+    def status(self, text):
+        self.logger.info('event=status text=%r', text)
+
+    def chapterFound(self, chapter):
+        self.logger.debug('event=chapterFound id=%s level=%d', chapter.id, chapter.level)
+
+    def chapterWritten(self, chapter, count):
+        self.logger.debug('event=chapterWritten id=%s path=%s count=%d', chapter.id, chapter.destPath, count)
+
+    def imagesFound(self, names):
+        self.logger.debug('event=imagesFound count=%d', len(names))
+
+    def done(self, text='Done.'):
+        self.logger.info('event=done text=%r', text)
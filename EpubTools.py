@@ -26,16 +26,199 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import os
 import re
 import shutil
+import urllib
+import posixpath
 import tempfile
 import hashlib
+import mimetypes
+import traceback
 import zipfile
 import unzip
 import xmlpp
+import EpubZip
 import codecs
+import collections
+import multiprocessing
+import multiprocessing.pool
 
-from time import strftime
-from mako.template import Template
-from xml.etree import ElementTree as ET
+from time import strftime, gmtime
+from cStringIO import StringIO
+from HTMLParser import HTMLParser
+from mako.lookup import TemplateLookup
+# The C parser is many times faster reading OPF files when indexing a library
+try:
+    from xml.etree import cElementTree as ET
+except ImportError:
+    from xml.etree import ElementTree as ET
+from EpubProgress import ProgressSink
+from EpubZip import EpubArchive, CompressionPolicy
+
+# Location of the Mako templates, and where their compiled modules are kept
+# so they only have to be compiled once (even between runs)
+supportDir = 'support'
+
+_templateLookup = None
+
+# Patterns used on every line of a book, so they are only compiled once
+newlinePattern = re.compile("\r?\n")
+tagPattern = re.compile(r'<[^<]*?/?>')
+idCharsPattern = re.compile(r'[^a-zA-Z0-9]')
+
+# Compiled stripSingleTag patterns by tag.  Like the re module's own cache
+# it is simply emptied when full: keeping it in least recently used order
+# (with an OrderedDict) costs more per call than compiling saves.
+tagPatternCache = {}
+tagPatternCacheSize = 64
+
+def getTagPattern(tag):
+    '''
+    Get the compiled pattern for the opening and closing forms of a tag
+    '''
+    pattern = tagPatternCache.get(tag)
+    if pattern is None:
+        pattern = re.compile(r'<[/]?(' + tag + r'|[' + tag + r']:\w+)[^>]*?>')
+        if len(tagPatternCache) >= tagPatternCacheSize:
+            tagPatternCache.clear()
+        tagPatternCache[tag] = pattern
+    return pattern
+
+def getTemplateModuleDir():
+    '''
+    Get the folder for the compiled templates, or None to keep them in
+    memory when it cannot be written to
+    '''
+    # Per user, and per install so another copy's templates are never used
+    if os.name == 'nt':
+        cacheRoot = os.environ.get('LOCALAPPDATA', '') or tempfile.gettempdir()
+    else:
+        cacheRoot = os.environ.get('XDG_CACHE_HOME', '') or os.path.join(os.path.expanduser('~'), '.cache')
+    installHash = hashlib.sha1(os.path.abspath(supportDir)).hexdigest()[:12]
+    moduleDir = os.path.join(cacheRoot, 'EpubStudio', 'templates-' + installHash)
+    try:
+        if not os.path.isdir(moduleDir):
+            os.makedirs(moduleDir)
+    except OSError:
+        return None
+    if not os.access(moduleDir, os.W_OK):
+        return None
+    return moduleDir
+
+def getTemplate(name):
+    '''
+    Get a compiled template from the support directory
+    '''
+    # The lookup keeps each template compiled for the life of the process and
+    # only recompiles one when the file's modified time changes
+    global _templateLookup
+    if _templateLookup is None:
+        _templateLookup = TemplateLookup(directories=[supportDir],
+                                         module_directory=getTemplateModuleDir(),
+                                         filesystem_checks=True)
+    return _templateLookup.get_template(name)
+
+def renderChapter(title, chapter):
+    '''
+    Render a chapter file from the template
+    '''
+    chapterText = getTemplate('chapter.xml').render(title=title, chapter=chapter)
+    return newlinePattern.sub("\n", chapterText)
+
+def hashInputs(templateName, *inputs):
+    '''
+    Get a hash of everything a generated file depends on: the template (by
+    its modified time) and the values it is rendered from
+    '''
+    sha = hashlib.sha1(templateName)
+    sha.update(repr(os.path.getmtime(os.path.join(supportDir, templateName))))
+    for item in inputs:
+        sha.update(repr(item))
+    return sha.hexdigest()
+
+# Change this whenever the EPUB built from the same inputs changes, so
+# build caches do not hand back EPUB files made by older code
+buildKeyVersion = '2'
+
+def hashFile(sha, path):
+    '''
+    Add the contents of a file to a hash
+    '''
+    with open(path, 'rb') as f:
+        while 1:
+            buf = f.read(64 * 1024)
+            if not buf:
+                break
+            sha.update(buf)
+
+# Namespaces of the container, OPF and NCX files
+containerNs = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+opfNs = '{http://www.idpf.org/2007/opf}'
+dcNs = '{http://purl.org/dc/elements/1.1/}'
+ncxNs = '{http://www.daisy.org/z3986/2005/ncx/}'
+
+# Dublin Core elements copied straight to the EpubBook attribute of the same
+# name, keyed by the full tag name so iterparse only needs a dict lookup
+dcFields = dict((dcNs + name, name) for name in
+                ['title', 'identifier', 'language', 'publisher', 'description', 'coverage', 'source', 'rights'])
+
+# Manifest media types used for embedded fonts (besides font/*)
+fontTypes = set(['application/x-font-ttf', 'application/x-font-truetype', 'application/x-font-opentype',
+                 'application/vnd.ms-opentype', 'application/font-sfnt', 'application/font-woff',
+                 'application/x-font-woff'])
+
+# Extensions of the documents EpubBook.normalizeContent reformats
+contentTypes = set(['.xhtml', '.html', '.htm', '.xml', '.opf', '.ncx'])
+
+def normalizeDocument(data):
+    '''
+    Pretty print an XHTML, OPF or NCX document with Unix line endings
+    '''
+    data = newlinePattern.sub("\n", data)
+    # xmlpp drops any text outside the elements, so only pretty print
+    # documents that are well-formed
+    try:
+        ET.fromstring(data)
+    except ET.ParseError:
+        return data
+    return xmlpp.get_pprint(data)
+
+def getImageType(name):
+    '''
+    Get the media type of an image file from its name
+    '''
+    return mimetypes.guess_type(name)[0] or 'image/jpeg'
+
+def makeManifestItem(itemId, href, mediaType):
+    '''
+    Get an EpubItem for a CSS or font file listed as it is in the manifest
+    '''
+    item = EpubItem()
+    item.id = itemId
+    item.href = href
+    item.mimeType = mediaType
+    return item
+
+def _renderChapterJob(job):
+    # Pool workers can only be handed a single picklable argument
+    return renderChapter(*job)
+
+def _normalizeJob(job):
+    # Only send the document back when it has changed
+    name, data = job
+    text = normalizeDocument(data)
+    if text == data:
+        text = None
+        textHash = hashlib.sha1(data).hexdigest()
+    else:
+        textHash = hashlib.sha1(text).hexdigest()
+    return name, textHash, text
+
+def _readMetadataJob(fileName):
+    # Hand back the error instead of raising it so one bad EPUB does not
+    # stop a whole scan
+    try:
+        return fileName, EpubProcessor.readEpubMetadata(fileName), ''
+    except Exception:
+        return fileName, None, traceback.format_exc()
 
 class EpubItem:
     '''
@@ -55,7 +238,210 @@ class EpubItem:
         self.nameNotIndented = ''
         self.authorLastHash = ''
         self.titleHash = ''
-        
+
+    def renderCopy(self):
+        '''
+        Get a lightweight copy with only what the chapter template needs
+        '''
+        item = EpubItem()
+        item.name = self.name
+        item.title = self.title
+        item.text = self.text
+        item.destPath = self.destPath
+        for child in self.children:
+            childItem = EpubItem()
+            childItem.name = child.name
+            childItem.title = child.title
+            childItem.destPath = child.destPath
+            item.children.append(childItem)
+        return item
+
+class ChapterParser(HTMLParser):
+    '''
+    Split the body of an HTML document into chapters at its h1-h6 headings
+
+    Feed it the document in pieces; each chapter is added to done as
+    (level, heading markup, body markup) once the next heading (or the end
+    of the body) is reached, so only the current chapter is kept in memory.
+    Anything before the first heading is left out.
+    '''
+    headingLevels = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.done = collections.deque()
+        self.inBody = False
+        self.headingTag = None
+        self.heading = None
+        self.current = None
+
+    def closeHeading(self):
+        if self.heading is not None:
+            self.current = (self.headingLevels[self.headingTag], ''.join(self.heading), [])
+            self.headingTag = None
+            self.heading = None
+
+    def finishChapter(self):
+        self.closeHeading()
+        if self.current is not None:
+            level, heading, parts = self.current
+            self.done.append((level, heading, ''.join(parts)))
+            self.current = None
+
+    def append(self, markup):
+        if self.heading is not None:
+            self.heading.append(markup)
+        elif self.current is not None:
+            self.current[2].append(markup)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body':
+            self.inBody = True
+        elif self.inBody and self.heading is None and tag in self.headingLevels:
+            self.finishChapter()
+            self.headingTag = tag
+            self.heading = []
+        else:
+            self.append(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        self.append(self.get_starttag_text())
+
+    def parse_endtag(self, i):
+        # Remember where the end tag starts, so it can be copied as written
+        # (handle_endtag is only given the name in lower case)
+        self.endTagStart = i
+        return HTMLParser.parse_endtag(self, i)
+
+    def getEndTagText(self):
+        '''
+        Get the end tag being handled as it was written
+        '''
+        i = self.endTagStart
+        return self.rawdata[i:self.rawdata.find('>', i + 1) + 1]
+
+    def handle_endtag(self, tag):
+        if tag == self.headingTag:
+            self.closeHeading()
+        elif tag in ('body', 'html'):
+            self.finishChapter()
+            self.inBody = False
+        else:
+            self.append(self.getEndTagText())
+
+    def handle_data(self, data):
+        self.append(data)
+
+    def handle_entityref(self, name):
+        self.append('&' + name + ';')
+
+    def handle_charref(self, name):
+        self.append('&#' + name + ';')
+
+    def handle_comment(self, data):
+        self.append('<!--' + data + '-->')
+
+    def handle_decl(self, decl):
+        self.append('<!' + decl + '>')
+
+    def handle_pi(self, data):
+        self.append('<?' + data + '>')
+
+    def unknown_decl(self, data):
+        self.append('<![' + data + ']>')
+
+    def close(self):
+        HTMLParser.close(self)
+        self.finishChapter()
+
+class EpubDirWriter:
+    '''
+    Write the EPUB files into a folder (used when editing the files)
+    '''
+    def __init__(self, baseEpubDir):
+        self.baseEpubDir = baseEpubDir
+
+    def getPath(self, name):
+        '''
+        Get the full path of an archive name, creating its folder if needed
+        '''
+        path = os.path.join(self.baseEpubDir, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        return path
+
+    def writeFile(self, name, data):
+        with open(self.getPath(name), 'w') as f:
+            f.write(data)
+
+    def copyFile(self, srcPath, name):
+        shutil.copy(srcPath, self.getPath(name))
+
+    def getStamp(self, name):
+        '''
+        Get the (modified time, size) of a written file, or None if missing
+        '''
+        path = os.path.join(self.baseEpubDir, *name.split('/'))
+        if not os.path.isfile(path):
+            return None
+        st = os.stat(path)
+        return st.st_mtime, st.st_size
+
+    def close(self):
+        pass
+
+class EpubZipWriter:
+    '''
+    Write the EPUB files straight into the EPUB archive, compressed as
+    the CompressionPolicy says
+
+    A deterministic archive gives every file the same fixed time stamp.
+    The archive is written to a temp file that only replaces epubFile once
+    it is closed, so a failed build leaves any existing EPUB as it was.
+    '''
+    def __init__(self, epubFile, policy=None, deterministic=False):
+        if policy is None:
+            policy = CompressionPolicy()
+        self.policy = policy
+        self.deterministic = deterministic
+        self.epubFile = epubFile
+        self.tempFile = epubFile + '.tmp'
+        self.zipArchive = zipfile.ZipFile(self.tempFile, 'w')
+
+        # Be sure to zip (uncompressed) the mimetype file first as
+        # dictacted by the EPUB specification
+        try:
+            EpubZip.writeFile(self.zipArchive, os.path.join(supportDir, 'mimetype'), 'mimetype', zipfile.ZIP_STORED, deterministic=deterministic)
+        except:
+            self.abort()
+            raise
+
+    def writeFile(self, name, data):
+        info = EpubZip.makeDataInfo(name, self.deterministic)
+        compressType, level = self.policy.getMethod(name)
+        EpubZip.writeCompressed(self.zipArchive, info, compressType, level, EpubZip.compressData(data, compressType, level))
+
+    def copyFile(self, srcPath, name):
+        compressType, level = self.policy.getMethod(name)
+        EpubZip.writeFile(self.zipArchive, srcPath, name, compressType, level, self.deterministic)
+
+    def getStamp(self, name):
+        # A new archive never holds anything worth keeping
+        return None
+
+    def close(self):
+        self.zipArchive.close()
+        if os.path.isfile(self.epubFile):
+            os.remove(self.epubFile)
+        os.rename(self.tempFile, self.epubFile)
+
+    def abort(self):
+        '''
+        Throw away the archive written so far
+        '''
+        self.zipArchive.close()
+        os.remove(self.tempFile)
+
 class EpubBook:
     '''
     EPUB Book Class
@@ -68,10 +454,16 @@ class EpubBook:
     metaDir = ''
     cssDir = ''
     imagesDir = ''
+    opsName = 'OPS'
+    writer = None
+    archive = None
         
-    def __init__(self, fileName, statusBar, imageCombo):
+    def __init__(self, fileName, progress=None):
         '''
         Initialize the class and set the EPUB properties and variables
+
+        Progress is reported to a ProgressSink (see EpubProgress), which
+        ignores everything by default.
         '''
         self.fileName = fileName
         self.epubFileName = ''
@@ -97,10 +489,40 @@ class EpubBook:
         self.fonts = []
         self.toc = ''
         self.href = ''
-        self.statusBar = statusBar
-        self.imageCombo = imageCombo
-        
+        if progress is None:
+            progress = ProgressSink()
+        self.progress = progress
+
+        # Number of threads (or processes) used to render the chapters
+        self.renderWorkers = 1
+        self.renderProcesses = False
+
+        # Number of threads used to compress the files when saving, and how
+        # each file is compressed (see EpubZip.compressionProfiles)
+        self.archiveWorkers = 1
+        self.compression = CompressionPolicy()
+
+        # Build archives that only depend on the content (sorted members and
+        # fixed time stamps); see also dateCreated below
+        self.deterministic = False
+
+        # Archive name -> (inputs hash, (mtime, size)) of each generated file
+        # so a rebuild only rewrites the files whose inputs have changed
+        self.buildManifest = {}
+
+        # Archive name -> hash of each content document as normalizeContent
+        # left it, so documents not touched since are skipped next time
+        self.normalized = {}
+
         self.dateCreated = strftime('%Y-%m-%d') #%H:%M:%S')
+        # Set when dateCreated was given rather than taken from today, so
+        # it becomes part of the build key
+        self.dateFixed = False
+        # Honour SOURCE_DATE_EPOCH (from reproducible-builds.org) so the
+        # ops-publication date can be pinned for repeatable builds
+        if os.environ.get('SOURCE_DATE_EPOCH', '') <> '':
+            self.dateCreated = strftime('%Y-%m-%d', gmtime(int(os.environ['SOURCE_DATE_EPOCH'])))
+            self.dateFixed = True
         self.creator = "EPUB Author";
         self.language = "en-US";
     
@@ -109,10 +531,64 @@ class EpubBook:
         Choose mode: Edit or Create
         '''
         if os.path.splitext(self.fileName)[1].lower() == ".epub":
-            self.parseEpub(self.fileName)
+            self.openEpub(self.fileName)
         else:
             self.createEpub(self.fileName)
     
+    def isEpubFile(self, name):
+        '''
+        Check a file exists in the EPUB being edited, by its archive name
+        '''
+        if self.archive is not None:
+            return self.archive.isFile(name)
+        return os.path.isfile(os.path.join(self.baseEpubDir, *name.split('/')))
+
+    def readEpubFile(self, name):
+        '''
+        Read a file from the EPUB being edited, by its archive name
+        '''
+        if self.archive is not None:
+            return self.archive.read(name)
+        with open(os.path.join(self.baseEpubDir, *name.split('/')), 'rb') as f:
+            return f.read()
+
+    def epubNames(self):
+        '''
+        Get the archive names of all the files in the EPUB being edited
+        '''
+        if self.archive is not None:
+            return [name for name in self.archive.namelist() if self.archive.isFile(name)]
+
+        names = []
+        for root, dirs, files in os.walk(self.baseEpubDir):
+            dirs.sort()
+            for fname in sorted(files):
+                path = os.path.relpath(os.path.join(root, fname), self.baseEpubDir)
+                names.append(path.replace(os.sep, '/'))
+        return names
+
+    def readPackage(self):
+        '''
+        Fill in the book details, chapters (in spine order), images, CSS and
+        fonts from the OPF and NCX files of the EPUB being edited
+        '''
+        opfPath = self.opsName + '/content.opf'
+        if self.isEpubFile('META-INF/container.xml'):
+            opfPath = EpubProcessor.readOpfPath(self.readEpubFile('META-INF/container.xml'))
+        if not self.isEpubFile(opfPath):
+            self.progress.status('No OPF file found: ' + opfPath)
+            return
+
+        # A broken OPF or NCX should not stop the EPUB being opened to fix it
+        try:
+            EpubProcessor.readOpf(self, StringIO(self.readEpubFile(opfPath)))
+            if self.toc <> '':
+                ncxPath = posixpath.normpath(posixpath.join(posixpath.dirname(opfPath), self.toc))
+                if self.isEpubFile(ncxPath):
+                    EpubProcessor.readNcx(self, StringIO(self.readEpubFile(ncxPath)))
+        except ET.ParseError, e:
+            self.progress.status('Could not read {0}: {1}'.format(opfPath, e))
+
     def dirEntries(self, dir_name, subdir, *args):
         '''
         Get a list of files in a directory
@@ -137,9 +613,7 @@ class EpubBook:
         Add images to the image dropdown
         '''
         fileList = self.dirEntries(path, True, 'jpg', 'jpeg', 'gif', 'png', 'bmp')
-        self.imageCombo.Clear()
-        for fname in fileList:
-            self.imageCombo.Append(os.path.basename(fname))
+        self.progress.imagesFound([os.path.basename(fname) for fname in fileList])
 
     def addImages(self, paths):
         '''
@@ -161,21 +635,74 @@ class EpubBook:
         image.href = 'images/' + image.name
         image.destPath = image.name
         image.srcPath = fileName
+        image.mimeType = getImageType(image.name)
         self.images.append(image)
         
         # Copy the file to the temp dir for later archiving        
-        shutil.copy(fileName, os.path.join(self.imagesDir, image.name))
+        self.copyOpsFile(fileName, image.href)
 
-    def createEpub(self, fileName):
+    def writeOpsFile(self, name, data):
         '''
-        Create an EPUB file
+        Write a file to the OPS folder of the EPUB
+        '''
+        self.writer.writeFile(self.opsName + '/' + name, data)
+
+    def copyOpsFile(self, srcPath, name):
+        '''
+        Copy a file into the OPS folder of the EPUB
+        '''
+        self.writer.copyFile(srcPath, self.opsName + '/' + name)
+
+    def isCurrent(self, name, inputsHash):
+        '''
+        Check whether a generated OPS file was written from the same inputs
+        and has not been touched since
+        '''
+        name = self.opsName + '/' + name
+        stamp = self.writer.getStamp(name)
+        return stamp is not None and self.buildManifest.get(name) == (inputsHash, stamp)
+
+    def writeGeneratedFile(self, name, inputsHash, data):
+        '''
+        Write a generated OPS file and record the inputs it came from
+        '''
+        self.writeOpsFile(name, data)
+        name = self.opsName + '/' + name
+        self.buildManifest[name] = (inputsHash, self.writer.getStamp(name))
+
+    def getMetadataInputs(self):
+        '''
+        The book details used by the title page, OPF and TOC templates
+        '''
+        return (self.title, self.identifier, self.author, self.authorSort, self.creator,
+                self.publisher, self.description, self.coverage, self.source,
+                self.origPublishDate, self.dateCreated, self.subject, self.coverImage)
+
+    def getContentsInputs(self):
+        '''
+        The chapter, image, CSS and font lists used by the OPF and TOC templates
+        '''
+        chapters = [(chapter.id, chapter.name, chapter.title, chapter.destPath, chapter.linear, chapter.level,
+                     [child.destPath for child in chapter.children]) for chapter in self.chapters]
+        images = [(image.id, image.href, image.mimeType) for image in self.images]
+        others = [(item.id, item.href, item.mimeType) for item in self.css + self.fonts]
+        return chapters, images, others
+
+    def getChapterInputsHash(self, chapter):
+        '''
+        Hash everything the chapter template uses for a chapter
+        '''
+        children = [(child.name, child.title, child.destPath) for child in chapter.children]
+        return hashInputs('chapter.xml', self.title, chapter.name, chapter.title, chapter.text, children)
+
+    def parseFileName(self, fileName):
+        '''
+        Set the book details from the file name
         '''
-        
         # Grab the file name and split it
         # Expecting the following format:
         #   {Book Name} - {Author Last, First} - {Publisher(s) Name(s)} - {Year} - {Subject(s)}
         justFileName = os.path.splitext(os.path.basename(fileName))[0]
-        justPath = os.path.dirname(fileName)
         info = justFileName.split(" - ")
 
         # Has all info been provided?
@@ -207,48 +734,79 @@ class EpubBook:
             self.rights = ''
             self.source = ''
             self.subject = ''
-        
-        # Grab the list of chapters
-        self.chapters = EpubProcessor.parseHtml(fileName, self.statusBar)
-        
+
         # Create some default names and hashes (which will be used if obfuscating an ATOM library)
         defEpubName = info[1].split(',')[0].strip() + '_' + self.title.title()
         defEpubName = defEpubName.replace(' ', '')
         self.epubFileName = defEpubName + '.epub'
         self.epubFileNameHash = EpubProcessor.getShortHash(defEpubName)
-                
-        # Ready to start building EPUB file structure, so get a temp dir
-        # and build some folders
-        self.baseDir = tempfile.mkdtemp()
-        print self.baseDir
-        self.baseEpubDir = os.path.join(self.baseDir, defEpubName)
-        self.opsDir = os.path.join(self.baseEpubDir, EpubProcessor.getOpsDirName(self.baseEpubDir))
-        self.metaDir = os.path.join(self.baseEpubDir, 'META-INF')
-        self.cssDir = os.path.join(self.opsDir, 'css')
-        self.imagesDir = os.path.join(self.opsDir, 'images')
-        
-        os.makedirs(self.baseEpubDir)
-        os.makedirs(self.opsDir)
-        os.makedirs(self.metaDir)
-        os.makedirs(self.cssDir)
-        os.makedirs(self.imagesDir)
+
+        return defEpubName
+
+    def createEpub(self, fileName, epubFile=''):
+        '''
+        Create an EPUB file
+
+        When epubFile is supplied, the files are written straight into the
+        EPUB archive rather than a temp dir that has to be archived later
+        '''
+        defEpubName = self.parseFileName(fileName)
+
+        if epubFile <> '':
+            # Stream everything into the archive; the mimetype file is
+            # written first by the writer
+            self.baseDir = ''
+            self.baseEpubDir = ''
+            self.opsName = 'OPS'
+            self.buildManifest = {}
+            self.writer = EpubZipWriter(epubFile, self.compression, self.deterministic)
+        else:
+            # Ready to start building EPUB file structure, so get a temp dir
+            # and build some folders
+            self.baseDir = tempfile.mkdtemp()
+            self.progress.status('Building in ' + self.baseDir)
+            self.baseEpubDir = os.path.join(self.baseDir, defEpubName)
+            self.opsName = EpubProcessor.getOpsDirName(self.baseEpubDir)
+            self.opsDir = os.path.join(self.baseEpubDir, self.opsName)
+            self.metaDir = os.path.join(self.baseEpubDir, 'META-INF')
+            self.cssDir = os.path.join(self.opsDir, 'css')
+            self.imagesDir = os.path.join(self.opsDir, 'images')
+
+            os.makedirs(self.baseEpubDir)
+            os.makedirs(self.opsDir)
+            os.makedirs(self.metaDir)
+            os.makedirs(self.cssDir)
+            os.makedirs(self.imagesDir)
+
+            self.writer = EpubDirWriter(self.baseEpubDir)
+            self.writer.copyFile(os.path.join(supportDir, 'mimetype'), 'mimetype')
+            self.buildManifest = {}
+
+        try:
+            self.buildEpub(fileName, defEpubName)
+        except:
+            if epubFile <> '':
+                self.writer.abort()
+                self.writer = None
+            raise
+
+        if epubFile <> '':
+            self.writer.close()
+            self.writer = None
         
+        # Alert the user the file has been processed
+        self.progress.done()
+
+    def buildEpub(self, fileName, defEpubName):
+        '''
+        Write the files of a new EPUB with the current writer
+        '''
         # Start copying some default files from the support directory
-        shutil.copy(os.path.join('support', 'mimetype'), os.path.join(self.baseEpubDir, 'mimetype'))
-        shutil.copy(os.path.join('support', 'main.css'), os.path.join(self.cssDir, 'main.css'))
-        shutil.copy(os.path.join('support', 'container.xml'), os.path.join(self.metaDir, 'container.xml'))
+        self.copyOpsFile(os.path.join(supportDir, 'main.css'), 'css/main.css')
+        self.css = [makeManifestItem('main-css', 'css/main.css', 'text/css')]
+        self.writer.copyFile(os.path.join(supportDir, 'container.xml'), 'META-INF/container.xml')
                 
-        # Check to see if a default cover image exists
-        # Expecting:  {AuthorLast}_{Title(no spaces)}.jpg
-        if os.path.isfile(os.path.join(justPath, defEpubName + ".jpg")):
-            self.coverImage = defEpubName + ".jpg"
-            self.coverImageSource = os.path.join(justPath, defEpubName + ".jpg")
-        
-        # Default cover not found, so look for cover.jpg
-        if self.coverImage == '':
-            if os.path.isfile(os.path.join(justPath, "cover.jpg")):
-                self.coverImage = "cover.jpg"
-                self.coverImageSource = os.path.join(justPath, "cover.jpg")
+        self.findCoverImage(fileName, defEpubName)
         
         # A cover has been found, so setup the EPUB details
         if self.coverImage <> '':
@@ -258,11 +816,11 @@ class EpubBook:
             image.href = 'images/' + self.coverImage
             image.destPath = self.coverImage
             image.srcPath = self.coverImageSource
+            image.mimeType = getImageType(self.coverImage)
             self.images.append(image)
 
-            shutil.copy(self.coverImageSource, os.path.join(self.imagesDir, self.coverImage))
-            self.imageCombo.Clear()
-            self.imageCombo.Append(image.name)
+            self.copyOpsFile(self.coverImageSource, image.href)
+            self.progress.imagesFound([image.name])
 
         ### TODO: fully implement additional auto-discovery of images
         # Copy all of the images
@@ -270,82 +828,319 @@ class EpubBook:
         #    if image.id <> 'cover':
         #        shutil.copy(image.srcPath, os.path.join(self.imagesDir, image.name))
         #    
-        #    self.imageCombo.Clear()
-        #    self.imageCombo.Append(image)
+        #    self.progress.imagesFound([image.name])
         
         # Start creating the EPUB files themselves by splitting the supplied HTML file
+        # Each chapter is written as soon as the splitter finishes it, and
+        # self.chapters is filled in (in document order) along the way
         self.createTitlePage()
-        self.createChapters()
+        self.chapters = []
+        self.createChapters(EpubProcessor.iterHtml(fileName, self.progress, self.chapters))
         self.createContentOpf()
         self.createTOC()
+
+    def findCoverImage(self, fileName, defEpubName):
+        '''
+        Look for a cover image next to the HTML file
+        '''
+        justPath = os.path.dirname(fileName)
+        self.coverImage = ''
+        self.coverImageSource = ''
+
+        # Check to see if a default cover image exists
+        # Expecting:  {AuthorLast}_{Title(no spaces)}.jpg
+        if os.path.isfile(os.path.join(justPath, defEpubName + ".jpg")):
+            self.coverImage = defEpubName + ".jpg"
+            self.coverImageSource = os.path.join(justPath, defEpubName + ".jpg")
         
-        # Alert the user the file has been processed
-        self.statusBar.SetStatusText('Done.')
+        # Default cover not found, so look for cover.jpg
+        if self.coverImage == '':
+            if os.path.isfile(os.path.join(justPath, "cover.jpg")):
+                self.coverImage = "cover.jpg"
+                self.coverImageSource = os.path.join(justPath, "cover.jpg")
+
+    def getBuildKey(self, fileName):
+        '''
+        Get a hash of everything createEpub builds the EPUB from: the HTML
+        file (name and contents), the cover image, the support files and
+        the settings that change the output
+
+        The ops-publication date is only part of the key when it was given
+        (dateFixed) or the build is deterministic; otherwise the EPUB keeps
+        the date it was first built on.
+        '''
+        sha = hashlib.sha1(buildKeyVersion)
+        sha.update(os.path.basename(fileName))
+        hashFile(sha, fileName)
+
+        self.findCoverImage(fileName, self.parseFileName(fileName))
+        sha.update(self.coverImage)
+        if self.coverImageSource <> '':
+            hashFile(sha, self.coverImageSource)
+
+        for name in sorted(os.listdir(supportDir)):
+            path = os.path.join(supportDir, name)
+            if os.path.isfile(path):
+                sha.update(name)
+                hashFile(sha, path)
+
+        sha.update(repr((self.compression.level, self.compression.storeCompressed, self.deterministic)))
+        if self.deterministic or self.dateFixed:
+            sha.update(self.dateCreated)
+        return sha.hexdigest()
 
     def createContentOpf(self):
         '''
         Create the OPF file
         '''
-        # Use Mako to update the template
-        self.statusBar.SetStatusText('Creating OPF file...')
-        contentOPF = Template(filename='support/content.opf').render(book=self)
-        contentOPF = re.sub("\r?\n", "\n", contentOPF)
+        inputsHash = hashInputs('content.opf', self.getMetadataInputs(), self.getContentsInputs())
+        if self.isCurrent('content.opf', inputsHash):
+            return
 
-        with open(os.path.join(self.opsDir, 'content.opf') , 'w') as f:
-            f.write(contentOPF)
+        # Use Mako to update the template
+        self.progress.status('Creating OPF file...')
+        contentOPF = getTemplate('content.opf').render(book=self)
+        contentOPF = newlinePattern.sub("\n", contentOPF)
+        self.writeGeneratedFile('content.opf', inputsHash, contentOPF)
 
     def createTitlePage(self):
         '''
         Create the Title page
         '''
+        inputsHash = hashInputs('title.xml', self.getMetadataInputs())
+        if self.isCurrent('titlepage.xml', inputsHash):
+            return
+
         # Use Mako to update the template
-        self.statusBar.SetStatusText('Creating Title Page...')
-        titlePage = Template(filename='support/title.xml').render(book=self)
-        titlePage = re.sub("\r?\n", "\n", titlePage)
-        with open(os.path.join(self.opsDir, 'titlepage.xml') , 'w') as f:
-            f.write(titlePage)
+        self.progress.status('Creating Title Page...')
+        titlePage = getTemplate('title.xml').render(book=self)
+        titlePage = newlinePattern.sub("\n", titlePage)
+        self.writeGeneratedFile('titlepage.xml', inputsHash, titlePage)
         
-    def createChapters(self):
+    def createChapters(self, chapters=None, progress=None):
         '''
         Create each chapter
+
+        If chapters are supplied (from EpubProcessor.iterHtml), the text of
+        each one is released once written to keep memory use down.  The
+        progress callback is called as progress(chapter, count) from this
+        thread, in chapter order, after each chapter is written (or found to
+        be unchanged since it was last written).
+        '''
+        release = chapters is not None
+        if chapters is None:
+            chapters = self.chapters
+        if progress is None:
+            progress = self.progress.chapterWritten
+
+        if self.renderWorkers > 1:
+            self.createChaptersParallel(chapters, release, progress)
+            return
+
+        count = 0
+        for chapter in chapters:
+            inputsHash = self.getChapterInputsHash(chapter)
+            if self.isCurrent(chapter.destPath, inputsHash):
+                chapterText = None
+            else:
+                # Use Mako to update the template
+                # May have some issues with encoding, so be sure to remove special characters (or use UTF-8?)
+                chapterText = renderChapter(self.title, chapter)
+            self.writeChapter(chapter, inputsHash, chapterText, release)
+            count += 1
+            progress(chapter, count)
+
+    def createChaptersParallel(self, chapters, release, progress):
+        '''
+        Render the chapters across a pool of threads (or processes) while
+        writing them out here in order
+        '''
+        if self.renderProcesses:
+            pool = multiprocessing.Pool(self.renderWorkers)
+        else:
+            pool = multiprocessing.pool.ThreadPool(self.renderWorkers)
+
+        # Only keep a couple of chapters per worker in flight so memory use
+        # stays bounded when chapters are streamed from the splitter
+        inFlight = collections.deque()
+        count = 0
+        try:
+            for chapter in chapters:
+                inputsHash = self.getChapterInputsHash(chapter)
+                if self.isCurrent(chapter.destPath, inputsHash):
+                    # Nothing to render, but keep its place in the order
+                    result = None
+                else:
+                    if self.renderProcesses:
+                        job = (self.title, chapter.renderCopy())
+                    else:
+                        job = (self.title, chapter)
+                    result = pool.apply_async(_renderChapterJob, (job,))
+                inFlight.append((chapter, inputsHash, result))
+
+                if len(inFlight) >= self.renderWorkers * 2:
+                    count += 1
+                    self.writeRenderedChapter(inFlight.popleft(), release, progress, count)
+
+            while len(inFlight) > 0:
+                count += 1
+                self.writeRenderedChapter(inFlight.popleft(), release, progress, count)
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def writeRenderedChapter(self, entry, release, progress, count):
+        '''
+        Wait for a chapter from the pool to be rendered, then write it
+        '''
+        chapter, inputsHash, result = entry
+        chapterText = None
+        if result is not None:
+            chapterText = result.get()
+        self.writeChapter(chapter, inputsHash, chapterText, release)
+        progress(chapter, count)
+
+    def writeChapter(self, chapter, inputsHash, chapterText, release):
+        '''
+        Write a rendered chapter file (chapterText is None when the file
+        is already up to date)
         '''
-        for chapter in self.chapters:
-            # Use Mako to update the template
-            # May have some issues with encoding, so be sure to remove special characters (or use UTF-8?)
-            self.statusBar.SetStatusText('Creating Chapter file: ' + chapter.name)
-            chapterText = Template(filename='support/chapter.xml').render(title=self.title, chapter=chapter)
-            chapterText = re.sub("\r?\n", "\n", chapterText)
-            with open(os.path.join(self.opsDir, chapter.destPath) , 'w') as f:
-                f.write(chapterText)
+        if chapterText is not None:
+            self.writeGeneratedFile(chapter.destPath, inputsHash, chapterText)
+        if release:
+            chapter.text = []
 
     def createTOC(self):
         '''
         Create the Table of Contents
         '''
+        inputsHash = hashInputs('toc.ncx', self.getMetadataInputs(), self.getContentsInputs())
+        if self.isCurrent('toc.ncx', inputsHash):
+            return
+
         # Use Mako to update the template
-        self.statusBar.SetStatusText('Creating TOC file...')
-        tocNCX = Template(filename='support/toc.ncx').render(book=self)
-        tocNCX = re.sub("\r?\n", "\n", tocNCX)
-        with open(os.path.join(self.opsDir, 'toc.ncx') , 'w') as f:
-            f.write(tocNCX)
+        self.progress.status('Creating TOC file...')
+        tocNCX = getTemplate('toc.ncx').render(book=self)
+        tocNCX = newlinePattern.sub("\n", tocNCX)
+        self.writeGeneratedFile('toc.ncx', inputsHash, tocNCX)
+
+    def normalizeContent(self, workers=None):
+        '''
+        Reformat every XHTML, OPF and NCX document in the EPUB being edited
+        (as Reformat XML does for a single file) across a pool of processes
+
+        Documents that have not changed since they were last normalized are
+        skipped.  Returns the number of files rewritten.
+        '''
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers)
+
+        # Only keep a couple of documents per worker in flight so memory use
+        # stays bounded for large books
+        inFlight = collections.deque()
+        changed = 0
+        try:
+            for name in self.epubNames():
+                if os.path.splitext(name)[1].lower() not in contentTypes:
+                    continue
+                data = self.readEpubFile(name)
+                if self.normalized.get(name) == hashlib.sha1(data).hexdigest():
+                    continue
+
+                if pool is None:
+                    changed += self.writeNormalized(_normalizeJob((name, data)))
+                    continue
+                inFlight.append(pool.apply_async(_normalizeJob, ((name, data),)))
+                if len(inFlight) >= workers * 2:
+                    changed += self.writeNormalized(inFlight.popleft().get())
+
+            while len(inFlight) > 0:
+                changed += self.writeNormalized(inFlight.popleft().get())
+
+            if pool is not None:
+                pool.close()
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.join()
+
+        self.progress.done('Normalized {0} file(s).'.format(changed))
+        return changed
+
+    def writeNormalized(self, result):
+        '''
+        Write a normalized document (text is None when it was already
+        normalized), returning the number of files written
+        '''
+        name, textHash, text = result
+        self.progress.status('Normalizing ' + name)
+        self.normalized[name] = textHash
+        if text is None:
+            return 0
+        self.writer.writeFile(name, text)
+        return 1
 
     def parseEpub(self, fileName):
         '''
         Read the non-DRM EPUB file contents
         '''
         # Unzip the EPUB file to the temp dir
-        self.baseDir, self.baseEpubDir, self.epubFileName = EpubProcessor.unzipEpub(fileName)
+        self.baseDir, self.baseEpubDir, self.epubFileName = EpubProcessor.unzipEpub(fileName, self.progress)
         
         self.metaDir = os.path.join(self.baseEpubDir, 'META-INF')
         # Figure out the OPF file name and location using the container.xml        
-        self.opsDir = os.path.join(self.baseEpubDir, EpubProcessor.getOpsDirName(self.baseEpubDir))                   
+        self.opsName = EpubProcessor.getOpsDirName(self.baseEpubDir)
+        self.opsDir = os.path.join(self.baseEpubDir, self.opsName)
+        self.writer = EpubDirWriter(self.baseEpubDir)
+        self.buildManifest = {}
         self.cssDir = os.path.join(self.opsDir, 'css')
         self.imagesDir = os.path.join(self.opsDir, 'images')
         
-        self.addAllImageFiles(self.baseDir)
-        
-        # Current hack is to assign the EPUB filename to the title for the save dialog later
-        self.title = self.epubFileName.replace('.epub', '')
+        self.readPackage()
+        self.progress.imagesFound([image.name for image in self.images])
+
+    def openEpub(self, fileName):
+        '''
+        Open the non-DRM EPUB file for editing in place
+
+        Nothing is extracted: files are read from (and changes kept by) an
+        EpubArchive until the EPUB is saved.
+        '''
+        self.archive = EpubArchive(fileName)
+        self.writer = self.archive
+        self.buildManifest = {}
+        self.baseDir = ''
+        self.baseEpubDir = ''
+        self.epubFileName = os.path.basename(fileName)
+
+        # Figure out the OPF file name and location using the container.xml
+        self.opsName = 'OPS'
+        if self.archive.isFile('META-INF/container.xml'):
+            self.opsName = EpubProcessor.readOpsDirName(self.archive.read('META-INF/container.xml'))
+
+        self.readPackage()
+        self.progress.imagesFound([image.name for image in self.images])
+
+    def saveEpub(self, epubFile):
+        '''
+        Save the EPUB being edited
+        '''
+        if self.archive is not None:
+            self.archive.save(epubFile, self.progress, self.compression)
+            self.epubFileName = os.path.basename(epubFile)
+        else:
+            EpubProcessor.createArchive(self.baseEpubDir, epubFile, self.progress, self.archiveWorkers, self.compression, self.deterministic)
 
     def addToLibrary(self):
         '''
@@ -365,63 +1160,7 @@ class EpubProcessor:
         '''
         Parse an existing non-DRM EPUB file
         '''
-        # Necessary namespaces
-        ns = {
-            'pkg':'{http://www.idpf.org/2007/opf}',
-            'dc':'{http://purl.org/dc/elements/1.1/}'
-        }
-        
-        # Open the content.opf file and parse the root
-        with open(os.path.join(epub.opsDir, r'content.opf'), 'r') as fp:
-            root = ET.parse(fp).getroot()
-
-        # Grab the common one-to-one elements
-        elems = ['title', 'identifier', 'language', 'publisher', 'description', 'coverage', 'source', 'rights']
-        for item in elems:
-            epub.__dict__[item] = root.find('{0}metadata/{1}{2}'.format(ns['pkg'], ns['dc'], item)).text
-        
-        # Find the creator(s)
-        epub.creator = root.find('{0}metadata/{1}{2}'.format(ns['pkg'], ns['dc'], 'creator')).attrib['{0}file-as'.format(ns['pkg'])]
-        
-        # Find the publication date
-        for date in root.findall('{0}metadata/{1}{2}'.format(ns['pkg'], ns['dc'], 'date')):
-            if date.attrib['{0}event'.format(ns['pkg'])] == 'original-publication':
-                epub.origPublishDate = date.text
-                break;
-        
-        # Find all subjects
-        for subject in root.findall('{0}metadata/{1}{2}'.format(ns['pkg'], ns['dc'], 'subject')):
-            epub.subject += subject.text + ', '
-        
-        # Strip an ending ', '
-        if epub.subject[-2:] == ', ':
-            epub.subject = epub.subject[:-2]
-        
-        # Now, build the TOC by parsing all manifest items based on the media type
-        epub.toc = ''
-        for manifestItems in root.findall('{0}manifest/'.format(ns['pkg'])):
-            for item in manifestItems:
-                mediaType = item.attrib['media-type']
-                if mediaType == 'application/x-dtbncx+xml':
-                    epub.toc = item.attrib['href'] 
-                elif mediaType == 'text/css':
-                    epub.css.append(item.attrib['href'])
-                elif mediaType == 'image/jpeg':
-                    imageName = item.attrib['href']
-                    imageDir = ''
-                    pos = imageName.find('/')
-                    if pos > -1:
-                        imageDir = imageName[:(pos + 1)]
-                        imageName = imageName[(pos + 1):]
-                    image = EpubItem()
-                    image.id = os.path.splitext(imageName)[0]
-                    image.name = imageName
-                    image.href = imageDir + image.name
-                    image.destPath = image.name
-                    image.srcPath = ''
-                    epub.images.append(image)
-        
-        ### TODO: Need to add TOC processing to build chapter list
+        epub.readPackage()
         
         # Hash the author and title to be used in an obfuscated library
         epub.titleHash = EpubProcessor.getShortHash(epub.title)
@@ -439,84 +1178,297 @@ class EpubProcessor:
         
         if os.path.isfile(container):        
             with open(container, 'r') as fp:
-                root = ET.parse(fp).getroot()
-            
-            # Now find the OPS dir and return
-            rootfile = root.find('{0}rootfiles/{0}rootfile'.format('{urn:oasis:names:tc:opendocument:xmlns:container}'))
-            opsDir = rootfile.attrib['full-path']
-            opsDir = opsDir[:opsDir.find('/')]
+                opsDir = EpubProcessor.readOpsDirName(fp.read())
         
         return opsDir
+
+    @staticmethod
+    def readOpsDirName(containerXml):
+        '''
+        Get the OPS dir from the contents of a container.xml file
+        '''
+        opsDir = EpubProcessor.readOpfPath(containerXml)
+        return opsDir[:opsDir.find('/')]
+
+    @staticmethod
+    def readOpfPath(containerXml):
+        '''
+        Get the archive name of the OPF file from the contents of a
+        container.xml file
+        '''
+        root = ET.fromstring(containerXml)
+        rootfile = root.find('{0}rootfiles/{0}rootfile'.format(containerNs))
+        return rootfile.attrib['full-path']
+
+    @staticmethod
+    def readOpf(epub, source):
+        '''
+        Fill in the EPUB details, chapters (in spine order), images, CSS and
+        fonts from an OPF file (a file name or object), in a single pass
+
+        Paths are left relative to the OPF file, as they are in the manifest.
+        '''
+        manifest = {}
+        itemIds = []
+        spine = []
+        subjects = []
+        identifiers = []
+        uniqueId = ''
+        coverId = ''
+        tocId = ''
+        foundFields = set()
+        foundCreator = False
+
+        for event, elem in ET.iterparse(source):
+            tag = elem.tag
+            if tag == dcNs + 'identifier':
+                # Chosen once the package element says which is the book's
+                identifiers.append((elem.get('id', ''), (elem.text or '').strip()))
+            elif tag in dcFields:
+                # Only the first of a repeated element is kept
+                if tag not in foundFields:
+                    foundFields.add(tag)
+                    epub.__dict__[dcFields[tag]] = (elem.text or '').strip()
+            elif tag == dcNs + 'creator':
+                # Only the first creator is kept, as the primary author
+                if not foundCreator:
+                    foundCreator = True
+                    epub.author = (elem.text or '').strip()
+                    epub.authorSort = elem.get(opfNs + 'file-as', epub.author)
+                    epub.creator = epub.authorSort
+            elif tag == dcNs + 'date':
+                dateEvent = elem.get(opfNs + 'event', '')
+                if dateEvent == 'original-publication':
+                    epub.origPublishDate = (elem.text or '').strip()
+                elif dateEvent == 'ops-publication':
+                    epub.dateCreated = (elem.text or '').strip()
+            elif tag == dcNs + 'subject':
+                if elem.text:
+                    subjects.append(elem.text.strip())
+            elif tag == opfNs + 'meta':
+                if elem.get('name') == 'cover':
+                    coverId = elem.get('content', '')
+            elif tag == opfNs + 'item':
+                itemId = elem.get('id', '')
+                manifest[itemId] = (urllib.unquote(elem.get('href', '')), elem.get('media-type', ''))
+                itemIds.append(itemId)
+                # EPUB 3 marks the cover in the manifest instead
+                if coverId == '' and 'cover-image' in elem.get('properties', '').split():
+                    coverId = itemId
+            elif tag == opfNs + 'itemref':
+                spine.append((elem.get('idref', ''), elem.get('linear', 'yes')))
+            elif tag == opfNs + 'spine':
+                tocId = elem.get('toc', '')
+            elif tag == opfNs + 'package':
+                uniqueId = elem.get('unique-identifier', '')
+            else:
+                continue
+            # Everything needed has been taken from the element
+            elem.clear()
+
+        epub.subject = ', '.join(subjects)
+        # The identifier unique-identifier points to, or else the first
+        for idAttr, identifier in identifiers:
+            if idAttr == uniqueId:
+                epub.identifier = identifier
+                break
+        else:
+            if len(identifiers) > 0:
+                epub.identifier = identifiers[0][1]
+        # The templates add the URN prefix back to the identifier
+        if epub.identifier.startswith('urn:uuid:'):
+            epub.identifier = epub.identifier[len('urn:uuid:'):]
+        epub.toc = ''
+        epub.css = []
+        epub.fonts = []
+        epub.images = []
+        epub.coverImage = ''
+        for itemId in itemIds:
+            href, mediaType = manifest[itemId]
+            if mediaType == 'application/x-dtbncx+xml' or itemId == tocId:
+                epub.toc = href
+            elif mediaType == 'text/css':
+                epub.css.append(makeManifestItem(itemId, href, mediaType))
+            elif mediaType.startswith('image/'):
+                image = EpubItem()
+                image.name = posixpath.basename(href)
+                # As addImage does; the templates number the ids themselves
+                image.id = posixpath.splitext(image.name)[0]
+                image.href = href
+                image.destPath = image.name
+                image.mimeType = mediaType
+                if itemId == coverId:
+                    # The templates always give the cover image this id
+                    image.id = 'cover'
+                    epub.coverImage = image.name
+                epub.images.append(image)
+            elif mediaType.startswith('font/') or mediaType in fontTypes:
+                epub.fonts.append(makeManifestItem(itemId, href, mediaType))
+
+        epub.chapters = []
+        for idref, linear in spine:
+            # The title page is written by the templates, not from a chapter
+            if idref not in manifest or idref == 'titlepage':
+                continue
+            href, mediaType = manifest[idref]
+            chapter = EpubItem()
+            chapter.id = idref
+            chapter.name = idref
+            chapter.level = 1
+            chapter.destPath = href
+            chapter.mimeType = mediaType
+            chapter.linear = linear
+            epub.chapters.append(chapter)
+
+        return epub
+
+    @staticmethod
+    def readNcx(epub, source):
+        '''
+        Name the chapters from an NCX file (a file name or object) and
+        arrange them into the hierarchy of its navigation points
+
+        Chapters the NCX does not mention are left at the top level.
+        '''
+        chapters = dict((chapter.destPath, chapter) for chapter in epub.chapters)
+        placed = set()
+        # [label, chapter] of each navPoint open at the current position
+        navPoints = []
+
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            tag = elem.tag
+            if event == 'start':
+                if tag == ncxNs + 'navPoint':
+                    navPoints.append([None, None])
+            elif tag == ncxNs + 'text':
+                # The navLabel comes first, so the first text is the label
+                if navPoints and navPoints[-1][0] is None:
+                    navPoints[-1][0] = (elem.text or '').strip()
+            elif tag == ncxNs + 'content':
+                if navPoints:
+                    src = urllib.unquote(elem.get('src', '')).split('#')[0]
+                    chapter = chapters.get(src)
+                    # Later navPoints into the same file are only anchors
+                    if chapter is not None and src not in placed:
+                        placed.add(src)
+                        navPoints[-1][1] = chapter
+                        chapter.name, chapter.title = EpubProcessor.splitChapterLine(navPoints[-1][0] or chapter.id)
+                        # Nest under the closest navPoint that is a chapter
+                        chapter.level = 1
+                        for label, parent in reversed(navPoints[:-1]):
+                            if parent is not None:
+                                parent.children.append(chapter)
+                                chapter.level = parent.level + 1
+                                break
+            elif tag == ncxNs + 'navPoint':
+                navPoints.pop()
+                elem.clear()
+
+        return epub
+
+    @staticmethod
+    def readEpubMetadata(epubFile):
+        '''
+        Read the details of an EPUB file into an EpubBook without extracting it
+
+        Only container.xml and the OPF file are read from the archive, so the
+        chapters are left unnamed (the NCX is not read) and no other file is
+        decompressed.
+        '''
+        epub = EpubBook(epubFile)
+        epub.epubFileName = os.path.basename(epubFile)
+        with zipfile.ZipFile(epubFile, 'r') as zf:
+            EpubProcessor.readZipOpf(zf, epub)
+
+        return epub
+
+    @staticmethod
+    def readEpubCover(epubFile):
+        '''
+        Read the cover image named by the OPF file of an EPUB file, or None
+        when it does not have one
+        '''
+        epub = EpubBook(epubFile)
+        with zipfile.ZipFile(epubFile, 'r') as zf:
+            opfPath = EpubProcessor.readZipOpf(zf, epub)
+            for image in epub.images:
+                if image.id == 'cover':
+                    return zf.read(posixpath.normpath(posixpath.join(posixpath.dirname(opfPath), image.href)))
+
+        return None
+
+    @staticmethod
+    def readZipOpf(zf, epub):
+        '''
+        Read the OPF file of an open EPUB archive into an EpubBook,
+        returning the archive name of the OPF file
+        '''
+        opfPath = epub.opsName + '/content.opf'
+        if 'META-INF/container.xml' in zf.NameToInfo:
+            opfPath = EpubProcessor.readOpfPath(zf.read('META-INF/container.xml'))
+        epub.opsName = opfPath[:opfPath.find('/')]
+
+        # Parsed straight from the archive as it is decompressed
+        fp = zf.open(opfPath)
+        try:
+            EpubProcessor.readOpf(epub, fp)
+        finally:
+            fp.close()
+
+        return opfPath
+
+    @staticmethod
+    def findEpubFiles(path, recursive=True):
+        '''
+        Find the EPUB files in a directory, yielding them as they are found
+        '''
+        for root, dirs, files in os.walk(path):
+            for fname in sorted(files):
+                if os.path.splitext(fname)[1].lower() == '.epub':
+                    yield os.path.join(root, fname)
+            if not recursive:
+                break
+            dirs.sort()
+
+    @staticmethod
+    def scanEpubs(path, workers=None, recursive=True):
+        '''
+        Read the details of every EPUB file in a directory (or in a list of
+        files) across a pool of processes
+
+        Yields (file name, EpubBook, error) in the order the files are read;
+        the book is None and error is the traceback when a file fails.
+        '''
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        fileNames = path
+        if isinstance(path, basestring):
+            fileNames = EpubProcessor.findEpubFiles(path, recursive)
+
+        pool = multiprocessing.Pool(max(1, workers))
+        try:
+            # Hand the files out in chunks, reading an OPF takes far less time
+            # than passing a single file name to a worker and back
+            for result in pool.imap_unordered(_readMetadataJob, fileNames, 32):
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
     
     @staticmethod
-    def addToLibraryFile(libraryFile, epubData):
+    def addToLibraryFile(libraryFile, epub):
         '''
         Add an EPUB to an ATOM library file
         '''
-        ### TODO: Finish implementing functionality
-        newAuthor = epubData['creator']
-        newTitle = epubData['title']
-
-        baseEntry = ['    <entry>',
-                     '        <id>{0}</id>'.format(epubData['identifier']),
-                     '        <title>{0}</title>'.format(epubData['title']),
-                     '        <author>',
-                     '            <name>{0}</name>'.format(epubData['creator']),
-                     '        </author>',
-                     '        <content type="xhtml">',
-                     '            <div xmlns="http://www.w3.org/1999/xhtml">Published: {0}, Language: {1}, Subject: {2}</div>'.format(epubData['published'], epubData['language'], epubData['subject']),
-                     '        </content>',
-                     '        <summary>{0}</summary>'.format(epubData['description']),
-                     '        <updated>{0}Z</updated>'.format(strftime('%Y-%m-%d %H:%M:%S')),
-                     '        <link type="application/epub+zip" href="{0}/{1}.epub" />'.format(epubData['authorHash'], epubData['titleHash']),
-                     '        <link rel="http://opds-spec.org/opds-cover-image-thumbnail" type="image/jpeg" title="cover thumbnail" href="{0}/{1}_tn.jpg" />'.format(epubData['authorHash'], epubData['titleHash']),
-                     '        <link rel="http://opds-spec.org/opds-cover-image" type="image/jpeg" title="cover image" href="{0}/{1}.jpg" />'.format(epubData['authorHash'], epubData['titleHash']),
-                     '        <link rel="x-stanza-cover-image-thumbnail" type="image/jpeg" href="{0}/{1}_tn.jpg" />'.format(epubData['authorHash'], epubData['titleHash']),
-                     '        <link rel="x-stanza-cover-image" type="image/jpeg" href="{0}/{1}.jpg" />'.format(epubData['authorHash'], epubData['titleHash']),
-                     '    </entry>']
-        
-        with open(libraryFile, 'r') as libFile:
-            atom = libFile.read()
-        
-        # Pretty print and standardize the ATOM file to make parsing a little easier
-        atom = xmlpp.get_pprint(atom)
-        atom = atom.replace('\r\n', '\n')
-        entries = atom.split('\n')
-        
-        # Consider using xml rather than RegEx to parse the file
-        i = 0
-        for line in entries:
-            if line.strip() == '<entry>':
-                # Check to find the Alpha location in the file
-                match = re.search('<.*>(.*)</.*>', entries[i + 1])
-                curTitle = match.groups()[0]
-                match = re.search('<.*>(.*)</.*>', entries[i + 7])
-                curAuthor = match.groups()[0]
-                
-                if newAuthor > curAuthor:
-                    pass
-                elif newAuthor == curAuthor:
-                    if newTitle > curTitle:
-                        pass
-                    elif newTitle == curTitle:
-                        end = i + 1
-                        while entries[end].strip() <> '</entry>':
-                            end += 1
-                            
-                        entries[i:end + 1] = baseEntry
-                        break;
-                    else:
-                        entries[i:1] = baseEntry
-                        break
-                elif newAuthor < curAuthor:                 
-                    entries[i:1] = baseEntry
-                    break
-            i += 1
-        
-        # Now write the file out
-        with open(libraryFile, 'w') as f:
-            atom = '\n'.join(entries)[1:]
-            f.write(atom)
+        # Imported here as EpubLibrary is built on this module
+        from EpubLibrary import EpubLibrary
+        library = EpubLibrary(libraryFile)
+        library.addBook(epub)
+        library.save()
         
     @staticmethod
     def formatParagraph(paragraph):
@@ -550,131 +1502,161 @@ class EpubProcessor:
         '''
         Strip all HTML tags from a line of text
         '''
-        cleaned = re.compile(r'<[^<]*?/?>')
-        return cleaned.sub('', inputText)
+        return tagPattern.sub('', inputText)
+    
+    @staticmethod
+    def stripTagsMany(lines):
+        '''
+        Strip all HTML tags from each of a list of lines
+        '''
+        sub = tagPattern.sub
+        return [sub('', line) for line in lines]
     
     @staticmethod
     def stripSingleTag(inputText, tag):
         '''
         Strip a specific HTML tag from a line of text
         '''
-        cleaned = re.compile(r'<[/]?(' + tag + r'|[' + tag + r']:\w+)[^>]*?>')
-        return cleaned.sub('', inputText)
+        return getTagPattern(tag).sub('', inputText)
         
     @staticmethod
-    def parseHtml(path, statusBar):
+    def parseHtml(path, progress=None):
         '''
         Parse the HTML file to create EPUB Chapters
         '''
-        # Start at the BODY tag
-        foundBody = False
-        
-        # Build the chapter heading RegEx and sections holder
-        sectionLevels = {'<h1>': 1, '<h2>': 2, '<h3>': 3}
-        sectionStart = re.compile(r'<h[1-3]')
         sections = []
-        
-        r = re.compile(r'[^a-zA-Z0-9]')
-        with open(path) as fin:
-        #f = codecs.open('unicode.rst', encoding='utf-8')
-        #with codecs.open(path, encoding='utf-8') as fin:
-            for line in fin:
-                if foundBody == True:
-                    line = line.strip()
-                    if sectionStart.match(line):
-                        # Here is a chapter of some form
-                        section = EpubItem()
-                        section.level = sectionLevels[line[:4]]
-                        section.mimeType = 'application/xhtml+xml'
-                        # Parse the section name
-                        section.name, section.title = EpubProcessor.splitChapterLine(EpubProcessor.stripTags(line))
-                        
-                        ### TODO: Add more processing for Appendix, Epilogue, Introduction, etc...
-                        # Is it a footnotes section?
-                        if section.name.lower() == 'footnotes':
-                            section.linear = 'no'
-                        
-                        # Decide how to process the level: Chapter or a sub-Chapter
-                        if section.level > 1:
-                            # This is a sub-Chapter
-                            section.id = (EpubProcessor.findParentIds(sections, section.level) + section.name).replace(' ', '')
-                            section.id = r.sub('', section.id)
-                            
-                            # Some EPUB viewers cannot handle nested Chapters in the TOC
-                            # So, use an ugly hack to indent
-                            if section.level == 2:
-                                section.nameNotIndented = '....' + section.name
-                            elif section.level == 3:
-                                section.nameNotIndented = '........' + section.name
-                            else:
-                                section.nameNotIndented = '{0}{1}'.format(EpubProcessor.findParentNames(sections, section.level), section.name)
-                            
-                            # Build the name
-                            section.name = '{0}{1}'.format(EpubProcessor.findParentNames(sections, section.level), section.name)
-                        else:
-                            # Top level Chapter
-                            section.id = section.name.replace(' ', '')
-                            section.id = r.sub('', section.id)
-                        
-                        # Create the xml file for the EPUB
-                        section.destPath = section.id + '.xml'
-                        
-                        # Get the parent and append this to it for nested navigation
-                        parent = EpubProcessor.findParentIndex(sections, section.level)
-                        if parent > -1:
-                            sections[parent].children.append(section)
-                        sections.append(section)
-                        
-                        statusBar.SetStatusText('Found chapter: ' + section.id)
-                    elif line[:6].lower() <> r'</body' and line[:6].lower() <> r'</html':
-                        # Not at the end of the document, and not a new section, so keep adding
-                        # lines to the file to create the chapter body
-                        section.text.append(line)
-                
-                # Keep parsing until the BODY tag is found
-                if foundBody == False:
-                    if line[:5].lower() == r'<body':
-                        foundBody = True
-                
-        statusBar.SetStatusText('Done processing chapters.')
+        for section in EpubProcessor.iterHtml(path, progress, sections):
+            pass
+
         return sections
-    
-    @staticmethod
-    def findParentIndex(itemList, curItemLevel):
-        '''
-        Get the parent of an item in the list
-        '''
-        for i in xrange(len(itemList) - 1, -1, -1):
-            if itemList[i].level < curItemLevel:
-                return i
-        
-        return -1
 
     @staticmethod
-    def findParentIds(itemList, curItemLevel):
+    def iterHtml(path, progress=None, sections=None):
         '''
-        Get all Parent IDs of an item in the list
+        Split the HTML file into EPUB Chapters, yielding each one as soon
+        as it is complete
         '''
-        value = ''
-        for i in xrange(len(itemList) - 1, -1, -1):
-            if itemList[i].level < curItemLevel:
-                value = '{0}{1}'.format(itemList[i].id, value)
-                return value
-        
-        return ''
+        if progress is None:
+            progress = ProgressSink()
 
-    @staticmethod
-    def findParentNames(itemList, curItemLevel):
-        '''
-        Get all Parent names of an item in the list
-        '''
-        value = ''
-        for i in xrange(len(itemList) - 1, -1, -1):
-            if itemList[i].level < curItemLevel:
-                value = value
-                return value
+        # Build the sections holder; sections collects every chapter
+        # (without needing its text) in document order
+        if sections is None:
+            sections = []
+        section = None
+
+        # The open ancestors of the current chapter, one per level, so the
+        # parent of a new chapter is always at the top once deeper levels
+        # have been closed
+        openSections = []
+
+        # Chapters without text list their children instead, so hold on to
+        # them until they are closed and all of the children are known
+        pending = set()
         
-        return ''
+        r = idCharsPattern
+        parser = ChapterParser()
+        with open(path) as fin:
+            while True:
+                # Read the file a piece at a time, so the line layout does not
+                # matter and only the current chapter is held in memory
+                data = fin.read(64 * 1024)
+                if data:
+                    parser.feed(data)
+                else:
+                    parser.close()
+
+                while len(parser.done) > 0:
+                    level, heading, body = parser.done.popleft()
+
+                    # The previous chapter is complete
+                    if section is not None:
+                        if len(section.text) > 0:
+                            yield section
+                        else:
+                            pending.add(section)
+
+                    # Here is a chapter of some form
+                    section = EpubItem()
+                    section.level = level
+
+                    # Keep the chapter body a line at a time, without the rest
+                    # of the heading's line or the start of the next one
+                    lines = [line.strip() for line in body.split('\n')]
+                    if lines[0] == '':
+                        lines.pop(0)
+                    if len(lines) > 0 and lines[-1] == '':
+                        lines.pop()
+                    section.text = lines
+
+                    # Close any chapters at the same or a deeper level
+                    while len(openSections) > 0 and openSections[-1].level >= section.level:
+                        closed = openSections.pop()
+                        if closed in pending:
+                            pending.remove(closed)
+                            yield closed
+                    parent = None
+                    if len(openSections) > 0:
+                        parent = openSections[-1]
+
+                    section.mimeType = 'application/xhtml+xml'
+                    # Parse the section name
+                    section.name, section.title = EpubProcessor.splitChapterLine(' '.join(EpubProcessor.stripTags(heading).split()))
+                    
+                    ### TODO: Add more processing for Appendix, Epilogue, Introduction, etc...
+                    # Is it a footnotes section?
+                    if section.name.lower() == 'footnotes':
+                        section.linear = 'no'
+                    
+                    # Decide how to process the level: Chapter or a sub-Chapter
+                    if section.level > 1:
+                        # This is a sub-Chapter
+                        parentId = ''
+                        if parent is not None:
+                            parentId = parent.id
+                        section.id = (parentId + section.name).replace(' ', '')
+                        section.id = r.sub('', section.id)
+                        
+                        # Some EPUB viewers cannot handle nested Chapters in the TOC
+                        # So, use an ugly hack to indent
+                        if section.level == 2:
+                            section.nameNotIndented = '....' + section.name
+                        elif section.level == 3:
+                            section.nameNotIndented = '........' + section.name
+                        else:
+                            section.nameNotIndented = section.name
+                    else:
+                        # Top level Chapter
+                        section.id = section.name.replace(' ', '')
+                        section.id = r.sub('', section.id)
+                    
+                    # Create the xml file for the EPUB
+                    section.destPath = section.id + '.xml'
+                    
+                    # Append this to the parent for nested navigation
+                    if parent is not None:
+                        parent.children.append(section)
+                    openSections.append(section)
+                    sections.append(section)
+                    
+                    progress.chapterFound(section)
+
+                if not data:
+                    break
+
+        if section is not None:
+            if len(section.text) > 0:
+                yield section
+            else:
+                pending.add(section)
+
+        # Close everything still open
+        while len(openSections) > 0:
+            closed = openSections.pop()
+            if closed in pending:
+                yield closed
+                
+        progress.status('Done processing chapters.')
     
     @staticmethod
     def splitChapterLine(line):
@@ -702,45 +1684,146 @@ class EpubProcessor:
         for word in word_list[1:]:
             final.append(word in exceptions and word or word.capitalize())
         
-        return " ".join(final)
+        return " ".join(final)
     @staticmethod
-    def unzipEpub(zipsource):
+    def unzipEpub(zipsource, progress=None):
         '''
         Unzip the EPUB file to a temp file
         '''
+        if progress is None:
+            progress = ProgressSink()
+
         filename = os.path.splitext(zipsource)[0].split(os.sep)[-1]
         baseDir = os.path.dirname(zipsource) + '/temp/' #tempfile.mkdtemp()
         zipdest = os.path.join(baseDir, filename)
         os.makedirs(zipdest)
         
         unzipper = unzip.unzip()
-        unzipper.verbose = False
-        unzipper.percent = 100
+        unzipper.threads = multiprocessing.cpu_count()
+        unzipper.progress = lambda name, count, total: progress.status('Extracting {0} ({1} of {2})'.format(name, count, total))
         unzipper.extract(zipsource, zipdest)
 
         return baseDir, zipdest, filename + ".epub"
 
     @staticmethod
-    def createArchive(zipDir, epubFile):
+    def createArchive(zipDir, epubFile, progress=None, workers=1, policy=None, deterministic=False):
         '''
         Zip up a folder into the EPUB format
+
+        If epubFile already exists, the compressed data of every file that
+        has not changed since it was saved is copied across rather than
+        compressed again.  The new archive only replaces the old one once
+        it is complete.  With more than one worker the files are compressed
+        across a pool of threads; the archive is the same either way.
+        Each file is compressed as the CompressionPolicy says.  The files
+        are added in name order, and a deterministic archive gives every
+        file the same fixed time stamp and attributes.
         '''
+        if progress is None:
+            progress = ProgressSink()
+        if policy is None:
+            policy = CompressionPolicy()
+
+        previous = None
         if os.path.isfile(epubFile):
-            os.remove(epubFile)
-    
-        zipArchive = zipfile.ZipFile(epubFile, 'w')
+            try:
+                previous = zipfile.ZipFile(epubFile, 'r')
+            except zipfile.BadZipfile:
+                previous = None
+
+        tempFile = epubFile + '.tmp'
+        zipArchive = zipfile.ZipFile(tempFile, 'w')
         root_len = len(os.path.abspath(zipDir))
         
-        # Be sure to zip (uncompressed) the mimetype file first as
-        # dictacted by the EPUB specification
-        zipArchive.write(os.path.join(zipDir, 'mimetype'), 'mimetype', zipfile.ZIP_STORED)
-        for root, zipDirs, files in os.walk(zipDir):
-            archive_root = os.path.abspath(root)[root_len:]
-            for f in files:
-                if f.lower() != 'mimetype':
-                    fullpath = os.path.join(root, f)
-                    archive_name = os.path.join(archive_root, f)
-                    zipArchive.write(fullpath, archive_name, zipfile.ZIP_DEFLATED)
-        
-        zipArchive.close()
-        print 'Done.'
+        try:
+            # Be sure to zip (uncompressed) the mimetype file first as
+            # dictacted by the EPUB specification
+            EpubZip.writeFile(zipArchive, os.path.join(zipDir, 'mimetype'), 'mimetype', zipfile.ZIP_STORED, deterministic=deterministic)
+            members = []
+            for root, zipDirs, files in os.walk(zipDir):
+                archive_root = os.path.abspath(root)[root_len:]
+                for f in files:
+                    if f.lower() != 'mimetype':
+                        fullpath = os.path.join(root, f)
+                        archive_name = os.path.join(archive_root, f)
+                        members.append((fullpath, archive_name))
+
+            # The order os.walk lists files in depends on the file system
+            members.sort(key=lambda member: member[1].replace(os.sep, '/'))
+
+            if workers > 1:
+                EpubProcessor.addArchiveMembersParallel(zipArchive, members, previous, policy, workers, deterministic, progress)
+            else:
+                for fullpath, archive_name in members:
+                    job = EpubProcessor.getArchiveJob(fullpath, archive_name, previous, policy)
+                    EpubProcessor.addCompressedMember(zipArchive, archive_name, job, EpubZip.compressUnlessUnchanged(*job), previous, deterministic, progress)
+            zipArchive.close()
+        except:
+            zipArchive.close()
+            os.remove(tempFile)
+            raise
+        finally:
+            if previous is not None:
+                previous.close()
+
+        if os.path.isfile(epubFile):
+            os.remove(epubFile)
+        os.rename(tempFile, epubFile)
+
+        progress.done()
+
+    @staticmethod
+    def addArchiveMembersParallel(zipArchive, members, previous, policy, workers, deterministic, progress):
+        '''
+        Compress the files across a pool of threads while adding them to
+        the archive here in order
+        '''
+        pool = multiprocessing.pool.ThreadPool(workers)
+
+        # Only keep a couple of files per worker in flight so memory use
+        # stays bounded for large images
+        inFlight = collections.deque()
+        try:
+            for fullpath, archive_name in members:
+                job = EpubProcessor.getArchiveJob(fullpath, archive_name, previous, policy)
+                inFlight.append((archive_name, job, pool.apply_async(EpubZip.compressUnlessUnchanged, job)))
+
+                if len(inFlight) >= workers * 2:
+                    archive_name, job, result = inFlight.popleft()
+                    EpubProcessor.addCompressedMember(zipArchive, archive_name, job, result.get(), previous, deterministic, progress)
+
+            while len(inFlight) > 0:
+                archive_name, job, result = inFlight.popleft()
+                EpubProcessor.addCompressedMember(zipArchive, archive_name, job, result.get(), previous, deterministic, progress)
+
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    @staticmethod
+    def getArchiveJob(fullpath, archive_name, previous, policy):
+        '''
+        Get the arguments of EpubZip.compressUnlessUnchanged for a file
+        '''
+        zipName = archive_name.lstrip(os.sep).replace(os.sep, '/')
+        info = None
+        if previous is not None:
+            info = previous.NameToInfo.get(zipName)
+        compressType, level = policy.getMethod(zipName)
+        return info, fullpath, compressType, level
+
+    @staticmethod
+    def addCompressedMember(zipArchive, archive_name, job, compressed, previous, deterministic, progress):
+        '''
+        Add a compressed file (or copy the unchanged one when compressed is
+        None) to the archive
+        '''
+        info, fullpath, compressType, level = job
+        progress.status('Adding ' + archive_name)
+        if compressed is None:
+            EpubZip.copyUnchanged(previous, info, fullpath, zipArchive, deterministic)
+        else:
+            EpubZip.writeCompressedFile(zipArchive, fullpath, archive_name, compressType, level, compressed, deterministic)
@@ -0,0 +1,439 @@
+#!/usr/bin/env python
+'''
+Copyright (c) 2011-2012 Doug Thompson
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be included
+in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+Low level ZIP helpers for copying already compressed entries between
+archives without inflating and deflating them again, and an EPUB archive
+that can be edited in place
+'''
+
+import os
+import stat
+import time
+import zlib
+import struct
+import zipfile
+
+from EpubProgress import ProgressSink
+
+# Size of the fixed part of a local file header, and the offsets of the
+# file name and extra field lengths within it
+_localHeaderSize = 30
+_localHeaderLengths = 26
+
+_chunkSize = 64 * 1024
+
+# ZipFile.write compresses in blocks of this size
+_writeBlockSize = 8 * 1024
+
+# Time stamp and attributes given to every member of a deterministic
+# archive, so the same files always give the same bytes
+fixedDateTime = (1980, 1, 1, 0, 0, 0)
+fixedAttributes = (stat.S_IFREG | 0644) << 16L
+
+# Formats that are already compressed, so deflating them again costs time
+# for next to no saving (TrueType/OpenType fonts are not compressed)
+storedExtensions = set(['.jpg', '.jpeg', '.png', '.gif', '.woff', '.woff2',
+                        '.mp3', '.mp4', '.m4a', '.zip'])
+
+class CompressionPolicy:
+    '''
+    Decide how each member of an EPUB archive is compressed
+
+    The mimetype file is always stored.  Formats in storedExtensions are
+    stored when storeCompressed is set, and everything else is deflated at
+    the given zlib level.
+    '''
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION, storeCompressed=True):
+        self.level = level
+        self.storeCompressed = storeCompressed
+
+    def getMethod(self, name):
+        '''
+        Get the (compression type, level) for a member name
+        '''
+        if name == 'mimetype':
+            return zipfile.ZIP_STORED, self.level
+        if self.storeCompressed and os.path.splitext(name)[1].lower() in storedExtensions:
+            return zipfile.ZIP_STORED, self.level
+        return zipfile.ZIP_DEFLATED, self.level
+
+# Named policies: "fast" for quick saves, "smallest" for the smallest file
+compressionProfiles = {
+    'default': CompressionPolicy(),
+    'fast': CompressionPolicy(1),
+    'smallest': CompressionPolicy(9),
+}
+
+def fileCrc(path):
+    '''
+    Get the CRC-32 of a file the same way zipfile does
+    '''
+    crc = 0
+    with open(path, 'rb') as f:
+        while 1:
+            buf = f.read(_chunkSize)
+            if not buf:
+                break
+            crc = zipfile.crc32(buf, crc) & 0xffffffff
+    return crc
+
+def readRawEntry(srcZip, info):
+    '''
+    Get the compressed bytes of an entry exactly as they are stored
+    '''
+    fp = srcZip.fp
+    fp.seek(info.header_offset)
+    header = fp.read(_localHeaderSize)
+    if len(header) <> _localHeaderSize or header[:4] <> zipfile.stringFileHeader:
+        raise zipfile.BadZipfile('Bad local file header for ' + info.filename)
+
+    # The local name and extra field lengths may differ from the central
+    # directory, so skip over what is actually there
+    nameLength, extraLength = struct.unpack('<HH', header[_localHeaderLengths:_localHeaderSize])
+    fp.seek(info.header_offset + _localHeaderSize + nameLength + extraLength)
+    return fp.read(info.compress_size)
+
+def makeFileInfo(path, arcname, deterministic=False):
+    '''
+    Get a ZipInfo for a file exactly as ZipFile.write would create it
+    (name, time stamp and attributes)
+
+    A deterministic entry gets fixedDateTime and fixedAttributes instead
+    of the file's own.
+    '''
+    st = os.stat(path)
+    arcname = os.path.normpath(os.path.splitdrive(arcname)[1])
+    while arcname[0] in (os.sep, os.altsep):
+        arcname = arcname[1:]
+    if deterministic:
+        zinfo = zipfile.ZipInfo(arcname, fixedDateTime)
+        zinfo.external_attr = fixedAttributes
+    else:
+        zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+        zinfo.external_attr = (st.st_mode & 0xFFFF) << 16L
+    zinfo.file_size = st.st_size
+    return zinfo
+
+def makeDataInfo(name, deterministic=False):
+    '''
+    Get a ZipInfo for data written now
+    '''
+    if deterministic:
+        zinfo = zipfile.ZipInfo(name, fixedDateTime)
+        zinfo.external_attr = fixedAttributes
+    else:
+        zinfo = zipfile.ZipInfo(name, time.localtime()[0:6])
+        zinfo.external_attr = 0644 << 16L
+    return zinfo
+
+def getDeflateFlags(compressType, level):
+    '''
+    Get the general purpose flag bits that record the deflate level
+    (normal, maximum, fast or super fast) in an entry's header
+    '''
+    if compressType <> zipfile.ZIP_DEFLATED or level in (zlib.Z_DEFAULT_COMPRESSION, 6, 7, 8):
+        return 0x00
+    if level == 9:
+        return 0x02
+    if level <= 1:
+        return 0x06
+    return 0x04
+
+def compressData(data, compressType, level=zlib.Z_DEFAULT_COMPRESSION):
+    '''
+    Compress a string the same way ZipFile.writestr does, returning
+    (CRC, size, compressed data)
+    '''
+    crc = zipfile.crc32(data) & 0xffffffff
+    size = len(data)
+    if compressType == zipfile.ZIP_DEFLATED:
+        cmpr = zlib.compressobj(level, zlib.DEFLATED, -15)
+        data = cmpr.compress(data) + cmpr.flush()
+    return crc, size, data
+
+def compressFile(path, compressType, level=zlib.Z_DEFAULT_COMPRESSION):
+    '''
+    Compress a file the same way ZipFile.write does, returning
+    (CRC, size, compressed data)
+
+    Safe to call from several threads at once (zlib releases the GIL
+    while compressing).
+    '''
+    if compressType == zipfile.ZIP_DEFLATED:
+        cmpr = zlib.compressobj(level, zlib.DEFLATED, -15)
+    else:
+        cmpr = None
+
+    crc = 0
+    size = 0
+    data = []
+    with open(path, 'rb') as f:
+        while 1:
+            buf = f.read(_writeBlockSize)
+            if not buf:
+                break
+            size += len(buf)
+            crc = zipfile.crc32(buf, crc) & 0xffffffff
+            if cmpr:
+                buf = cmpr.compress(buf)
+            data.append(buf)
+    if cmpr:
+        data.append(cmpr.flush())
+    return crc, size, ''.join(data)
+
+def writeCompressed(destZip, zinfo, compressType, level, compressed):
+    '''
+    Add an entry compressed by compressFile or compressData
+    '''
+    crc, size, data = compressed
+    zinfo.compress_type = compressType
+    zinfo.flag_bits = getDeflateFlags(compressType, level)
+    zinfo.file_size = size
+    zinfo.compress_size = len(data)
+    zinfo.CRC = crc
+    writeRawEntry(destZip, zinfo, data)
+
+def writeCompressedFile(destZip, path, arcname, compressType, level, compressed, deterministic=False):
+    '''
+    Add a file compressed by compressFile; at the default level the entry
+    is identical to what ZipFile.write would have produced
+    '''
+    writeCompressed(destZip, makeFileInfo(path, arcname, deterministic), compressType, level, compressed)
+
+def writeFile(destZip, path, arcname, compressType, level=zlib.Z_DEFAULT_COMPRESSION, deterministic=False):
+    '''
+    Compress and add a file
+    '''
+    compressed = compressFile(path, compressType, level)
+    writeCompressedFile(destZip, path, arcname, compressType, level, compressed, deterministic)
+
+def writeRawEntry(destZip, zinfo, data):
+    '''
+    Add an entry whose data is already compressed (zinfo must have the
+    CRC, sizes and compression type of the data filled in)
+    '''
+    # The sizes are known up front, so there is no data descriptor
+    zinfo.flag_bits &= ~0x08
+    zinfo.header_offset = destZip.fp.tell()
+    destZip._writecheck(zinfo)
+    destZip._didModify = True
+
+    # Same choice of header as ZipFile.write so the result is identical
+    zip64 = destZip._allowZip64 and zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    destZip.fp.write(zinfo.FileHeader(zip64))
+    destZip.fp.write(data)
+    destZip.filelist.append(zinfo)
+    destZip.NameToInfo[zinfo.filename] = zinfo
+
+def isUnchanged(info, path, compressType, level=zlib.Z_DEFAULT_COMPRESSION):
+    '''
+    Check whether an existing entry holds the same content as a file,
+    compressed the same way
+    '''
+    st = os.stat(path)
+    if info.compress_type <> compressType or info.file_size <> st.st_size:
+        return False
+    if info.flag_bits & 0x06 <> getDeflateFlags(compressType, level):
+        return False
+    return info.CRC == fileCrc(path)
+
+def copyUnchanged(srcZip, info, path, destZip, deterministic=False):
+    '''
+    Add a file to destZip using the compressed data of an unchanged entry
+    of srcZip; the entry is otherwise identical to what ZipFile.write would
+    have produced
+    '''
+    zinfo = makeFileInfo(path, info.filename, deterministic)
+    zinfo.compress_type = info.compress_type
+    zinfo.flag_bits = info.flag_bits & 0x06
+    zinfo.file_size = info.file_size
+    zinfo.compress_size = info.compress_size
+    zinfo.CRC = info.CRC
+    writeRawEntry(destZip, zinfo, readRawEntry(srcZip, info))
+
+def compressUnlessUnchanged(info, path, compressType, level=zlib.Z_DEFAULT_COMPRESSION):
+    '''
+    Compress a file for writeCompressedFile, or get None if info (an entry
+    of an existing archive, if there is one) already holds the same content
+    '''
+    if info is not None and isUnchanged(info, path, compressType, level):
+        return None
+    return compressFile(path, compressType, level)
+
+def copyEntry(srcZip, info, destZip):
+    '''
+    Copy an entry (compressed data, time stamp and attributes) as it is
+    '''
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.flag_bits = info.flag_bits & 0x06
+    zinfo.comment = info.comment
+    zinfo.create_system = info.create_system
+    zinfo.external_attr = info.external_attr
+    zinfo.internal_attr = info.internal_attr
+    zinfo.file_size = info.file_size
+    zinfo.compress_size = info.compress_size
+    zinfo.CRC = info.CRC
+    writeRawEntry(destZip, zinfo, readRawEntry(srcZip, info))
+
+class EpubArchive:
+    '''
+    An EPUB opened for editing without extracting it
+
+    Only the central directory is read when opening; members are read when
+    asked for.  Changes are kept (in memory, or as the path of the file to
+    copy in) until save() writes a new archive, copying the compressed data
+    of every unchanged member across as it is.
+
+    Implements the same writeFile/copyFile interface as the EPUB writers
+    in EpubTools, so the book can write its generated files straight in.
+    '''
+    def __init__(self, epubFile):
+        self.epubFile = epubFile
+        self.zipArchive = zipfile.ZipFile(epubFile, 'r')
+        self.clearChanges()
+
+    def clearChanges(self):
+        self.changed = {}
+        self.copied = {}
+        self.removed = set()
+        self.added = []
+
+    def isModified(self):
+        return len(self.changed) > 0 or len(self.copied) > 0 or len(self.removed) > 0
+
+    def namelist(self):
+        '''
+        Get the member names (original order first, then new members)
+        '''
+        names = [name for name in self.zipArchive.namelist() if name not in self.removed]
+        return names + self.added
+
+    def isFile(self, name):
+        '''
+        Check a name is a member of the archive (and not a folder entry)
+        '''
+        if name.endswith('/') or name in self.removed:
+            return False
+        return name in self.changed or name in self.copied or name in self.zipArchive.NameToInfo
+
+    def read(self, name):
+        '''
+        Get the (uncompressed) contents of a member
+        '''
+        if name in self.removed:
+            raise KeyError('There is no item named %r in the archive' % name)
+        if name in self.changed:
+            return self.changed[name]
+        if name in self.copied:
+            with open(self.copied[name], 'rb') as f:
+                return f.read()
+        return self.zipArchive.read(name)
+
+    def addName(self, name):
+        self.removed.discard(name)
+        self.changed.pop(name, None)
+        self.copied.pop(name, None)
+        if name not in self.zipArchive.NameToInfo and name not in self.added:
+            self.added.append(name)
+
+    def writeFile(self, name, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.addName(name)
+        self.changed[name] = data
+
+    def copyFile(self, srcPath, name):
+        # The file itself is only read when saving
+        self.addName(name)
+        self.copied[name] = os.path.abspath(srcPath)
+
+    def removeFile(self, name):
+        self.changed.pop(name, None)
+        self.copied.pop(name, None)
+        if name in self.added:
+            self.added.remove(name)
+        if name in self.zipArchive.NameToInfo:
+            self.removed.add(name)
+
+    def getStamp(self, name):
+        # Writing into the archive only touches memory until it is saved
+        return None
+
+    def save(self, epubFile, progress=None, policy=None):
+        '''
+        Write the archive with all changes to epubFile, and carry on
+        editing that file
+
+        epubFile is only replaced once the new archive is complete, so it
+        can be the file being edited.  Changed files are compressed as the
+        CompressionPolicy says.
+        '''
+        if progress is None:
+            progress = ProgressSink()
+        if policy is None:
+            policy = CompressionPolicy()
+
+        names = self.namelist()
+        # Be sure to zip (uncompressed) the mimetype file first as
+        # dictacted by the EPUB specification
+        if 'mimetype' in names:
+            names.remove('mimetype')
+            names.insert(0, 'mimetype')
+
+        tempFile = epubFile + '.tmp'
+        dest = zipfile.ZipFile(tempFile, 'w')
+        try:
+            for name in names:
+                progress.status('Adding ' + name)
+                compressType, level = policy.getMethod(name)
+
+                # Unchanged members keep their compression, apart from a
+                # compressed mimetype file
+                if name in self.copied:
+                    writeFile(dest, self.copied[name], name, compressType, level)
+                elif name in self.changed or (name == 'mimetype' and self.zipArchive.getinfo(name).compress_type <> compressType):
+                    writeCompressed(dest, makeDataInfo(name), compressType, level, compressData(self.read(name), compressType, level))
+                else:
+                    copyEntry(self.zipArchive, self.zipArchive.getinfo(name), dest)
+            dest.close()
+        except:
+            dest.close()
+            os.remove(tempFile)
+            raise
+
+        self.zipArchive.close()
+        if os.path.isfile(epubFile):
+            os.remove(epubFile)
+        os.rename(tempFile, epubFile)
+
+        self.epubFile = epubFile
+        self.zipArchive = zipfile.ZipFile(epubFile, 'r')
+        self.clearChanges()
+
+        progress.done()
+
+    def close(self):
+        self.zipArchive.close()
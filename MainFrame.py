@@ -27,8 +27,13 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import wx
 import gui
 import os
-from EpubTools import EpubProcessor
+import posixpath
+import threading
+import multiprocessing
+import traceback
 from EpubTools import EpubBook
+from EpubProgress import WxProgressSink
+from EpubProgress import OperationCancelled
 import xmlpp
 import re
 
@@ -43,10 +48,17 @@ class MainFrame( gui.MainFrameBase ):
 	tempdirs = []
 	lastSearchPos = -1
 	matchObj = None
+	job = None
+	jobFailed = None
+	closing = False
 	
 	def __init__( self, parent ):
 		gui.MainFrameBase.__init__( self, parent )
 		
+		# Long running work happens on a worker thread, so progress is
+		# marshalled back to the GUI thread with wx.CallAfter
+		self.progress = WxProgressSink(self.m_statusBar, None, callAfter=wx.CallAfter)
+		
 		self.Bind(wx.EVT_CLOSE, self.onCloseWindow)
 
 	def m_mniOpenClick( self, event ):
@@ -58,36 +70,67 @@ class MainFrame( gui.MainFrameBase ):
 		self.m_statusBar.SetStatusText('')
 		fdlg = wx.FileDialog(self,'Choose a file', 'Open file', wx.EmptyString, '*.*', wx.FD_OPEN | wx.FD_FILE_MUST_EXIST);
 		if fdlg.ShowModal() == wx.ID_OK:
-			# Create an EpubBook instance and process the file
-			self.book = EpubBook(fdlg.GetPath(), self.m_statusBar, self.m_cbxCoverImage)
-			self.book.process()
-			# Collect the temp folders for later disposal
+			# Create an EpubBook instance and process the file in the background
+			book = EpubBook(fdlg.GetPath(), self.progress)
+			book.archiveWorkers = multiprocessing.cpu_count()
+			self.runJob(book.process, lambda: self.openFinished(book), lambda: self.openFailed(book))
+	
+	def openFinished(self, book):
+		'''
+		The book has been processed, so show it
+		'''
+		if hasattr(self, 'book') and self.book.archive is not None:
+			self.book.archive.close()
+		self.book = book
+		# Collect the temp folders for later disposal
+		if self.book.baseDir <> '':
 			self.tempdirs.append(self.book.baseDir)
-			# Add the file list to the tree control
-			self.populateTree(self.book.baseEpubDir, self.book.epubFileName)
-			
-			# Enable buttons and menus
-			self.m_mniAddImages.Enable()
-			self.m_mniRebuildContent.Enable()
-			self.m_mniAddToLibrary.Enable()
+		# Add the file list to the tree control
+		self.refreshTree()
+		self.showImages()
+		
+		# Enable buttons and menus
+		self.m_mniAddImages.Enable()
+		self.m_mniRebuildContent.Enable()
+		self.m_mniNormalize.Enable()
+		self.m_mniAddToLibrary.Enable()
+	
+	def openFailed(self, book):
+		'''
+		Processing was cancelled or failed, so clean up what was created
+		'''
+		if book.archive is not None:
+			book.archive.close()
+		if book.baseDir <> '':
+			self.tempdirs.append(book.baseDir)
 				
 	def m_mniSaveClick( self, event ):
 		'''
 		Save a file
 		'''
+		if self.job is not None:
+			return
 		# Save a file to disk
 		self.m_statusBar.SetStatusText('')
 		if self.curFileName <> '':
-			f = open(self.curFileName, 'w')
-			f.write(self.m_txtMain.GetValue())
-			f.close()		
+			if self.book.archive is not None:
+				# Kept with the archive until the EPUB is saved
+				self.book.archive.writeFile(self.curFileName, self.m_txtMain.GetValue())
+			else:
+				f = open(self.curFileName, 'w')
+				f.write(self.m_txtMain.GetValue())
+				f.close()		
 			self.m_statusBar.SetStatusText('File saved.')
 
 	def m_mniSaveEpubClick( self, event ):
 		'''
 		Save the EPUB to disk
 		'''
-		fdlg = wx.FileDialog(self,'Choose a file', 'Save file', self.book.title + '.epub', '*.epub', wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT);
+		# An opened EPUB is saved under its own name by default
+		defaultName = self.book.title + '.epub'
+		if os.path.splitext(self.book.fileName)[1].lower() == '.epub':
+			defaultName = self.book.epubFileName
+		fdlg = wx.FileDialog(self,'Choose a file', 'Save file', defaultName, '*.epub', wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT);
 		
 		if fdlg.ShowModal() == wx.ID_OK:
 			saveEpubAs = fdlg.GetPath()
@@ -95,18 +138,15 @@ class MainFrame( gui.MainFrameBase ):
 			if os.path.splitext(saveEpubAs)[1].lower() != '.epub':
 				saveEpubAs += '.epub'
 			
-			# Use a static method to create and save the EPUB
-			EpubProcessor.createArchive(self.book.baseEpubDir, saveEpubAs)
-			self.m_statusBar.SetStatusText('EPUB successfully saved.')
+			# An existing file is only replaced once the new one is complete
+			self.runJob(lambda: self.book.saveEpub(saveEpubAs),
+						lambda: self.m_statusBar.SetStatusText('EPUB successfully saved.'))
 			
 	def m_mniExitClick( self, event ):
 		'''
-		Clean up all temp folders and then Exit
+		Exit, which cleans up all temp folders (see onCloseWindow)
 		'''
-		try:
-			self.removeAllTempDirs()
-		finally:	
-			self.Close(True)
+		self.Close(True)
 	
 	def m_mniReformatClick( self, event ):
 		'''
@@ -119,6 +159,15 @@ class MainFrame( gui.MainFrameBase ):
 		body = xmlpp.get_pprint(body)
 		self.m_txtMain.SetValue(body)
 
+	def m_mniNormalizeClick( self, event ):
+		'''
+		Reformat every XHTML, OPF and NCX file in the EPUB
+		'''
+		self.m_statusBar.SetStatusText('')
+		# No process pool from the worker thread: forking there is not safe
+		# with wx, and the documents of one book are quick to reformat
+		self.runJob(lambda: self.book.normalizeContent(1), self.refreshTree)
+
 	def m_mniAddImagesClick( self, event ):
 		'''
 		Add images
@@ -132,7 +181,14 @@ class MainFrame( gui.MainFrameBase ):
 		self.rebuild()
 		
 	def m_mniAddToLibraryClick( self, event ):
-		self.book.addToLibrary()
+		'''
+		Add the book to the library feed in the background
+		'''
+		def addToLibrary():
+			self.book.addToLibrary()
+			self.progress.done('Added to the library.')
+		
+		self.runJob(addToLibrary, lambda: None)
 	
 	def m_mniAboutClick( self, event ):
 		'''
@@ -152,14 +208,121 @@ class MainFrame( gui.MainFrameBase ):
 		'''
 		Rebuild the EPUB structure and details
 		'''
-		self.book.createContentOpf()
-		self.book.createTOC()
-		self.populateTree(self.book.baseEpubDir, self.book.epubFileName)
-
+		def rebuildContent():
+			self.book.createContentOpf()
+			self.book.createTOC()
+			self.progress.done()
+		
+		self.runJob(rebuildContent, self.refreshTree)
+	
+	def m_mniCancelClick( self, event ):
+		'''
+		Cancel the running background job
+		'''
+		if self.job is not None:
+			self.progress.cancel()
+			self.m_statusBar.SetStatusText('Cancelling...')
+	
+	def runJob(self, work, finished, failed=None):
+		'''
+		Run work on a background thread, then call finished (or failed, if
+		the work raised or was cancelled) back on the GUI thread
+		'''
+		if self.job is not None:
+			wx.Bell()
+			return
+		
+		self.progress.reset()
+		self.enableJobMenus(False)
+		self.jobFailed = failed
+		self.job = threading.Thread(target=self.jobThread, args=(work, finished, failed))
+		self.job.daemon = True
+		self.job.start()
+	
+	def jobThread(self, work, finished, failed):
+		'''
+		Background thread body
+		'''
+		error = None
+		try:
+			work()
+		except OperationCancelled:
+			error = ''
+		except Exception:
+			error = traceback.format_exc()
+		wx.CallAfter(self.jobFinished, finished, failed, error)
+	
+	def jobFinished(self, finished, failed, error):
+		'''
+		Back on the GUI thread once the background job is done
+		'''
+		# Queued before the window closed, and the frame is going
+		if self.closing:
+			return
+		self.job = None
+		self.enableJobMenus(True)
+		
+		if error is None:
+			finished()
+			return
+		
+		if failed is not None:
+			failed()
+		if error == '':
+			self.m_statusBar.SetStatusText('Cancelled.')
+		else:
+			self.m_statusBar.SetStatusText('Failed.')
+			wx.MessageBox(error, 'EPUB Studio', wx.OK | wx.ICON_ERROR)
+	
+	def enableJobMenus(self, enable):
+		'''
+		Only one job can run at a time, and nothing may change the book
+		while it does (a save reads the changes and reopens the archive)
+		'''
+		self.m_mniOpen.Enable(enable)
+		self.m_mniSave.Enable(enable)
+		self.m_mniSaveEpub.Enable(enable)
+		self.m_mniCancel.Enable(not enable)
+		self.m_btnDelete.Enable(enable)
+		self.m_btnAddCoverTag.Enable(enable)
+		self.m_treeFiles.Enable(enable)
+		if hasattr(self, 'book'):
+			self.m_mniAddImages.Enable(enable)
+			self.m_mniAddToLibrary.Enable(enable)
+			self.m_mniRebuildContent.Enable(enable)
+			self.m_mniNormalize.Enable(enable)
+	
+	def showImages(self):
+		'''
+		Fill the cover image combo with the images found by the last job
+		'''
+		self.m_cbxCoverImage.Clear()
+		for name in self.progress.images:
+			self.m_cbxCoverImage.Append(name)
+	
+	def stopJob(self):
+		'''
+		Give a running job the chance to stop before removing its files,
+		returning False when it is still running
+		'''
+		job = self.job
+		if job is None:
+			return True
+		self.progress.cancel()
+		job.join(5)
+		if job.is_alive():
+			return False
+		# jobFinished does nothing once closing, so clean up here instead
+		if self.jobFailed is not None:
+			self.jobFailed()
+		return True
+	
 	def addImages(self):
 		'''
 		Add images to the OPF
 		'''
+		if self.job is not None:
+			return
 		self.m_statusBar.SetStatusText('')
 		fdlg = wx.FileDialog(self,'Choose one or more image files', 'Open file(s)', wx.EmptyString, '*.jpg', wx.FD_OPEN | wx.FD_FILE_MUST_EXIST | wx.FD_MULTIPLE)
 		
@@ -167,12 +330,14 @@ class MainFrame( gui.MainFrameBase ):
 			self.book.addImages(fdlg.GetPaths())
 		
 		# Re-populate the tree with the updated file list
-		self.populateTree(self.book.baseEpubDir, self.book.epubFileName)
+		self.refreshTree()
 		
 	def m_treeFilesSelChanged( self, event ):
 		'''
 		Simplified text editor functionality
 		'''
+		if self.job is not None:
+			return
 		self.m_statusBar.SetStatusText('')
 		
 		# Grab the filename and make sure it is not an image
@@ -183,7 +348,15 @@ class MainFrame( gui.MainFrameBase ):
 
 		self.m_txtMain.Value = ''
 		self.curFileName = ''
-		if os.path.isfile(filename):
+		if self.book.archive is not None:
+			# Only read from the archive now the file has been selected
+			if self.book.archive.isFile(filename):
+				if extension.lower() not in imgs:
+					self.curFileName = filename
+					self.m_txtMain.Value = self.book.archive.read(filename)
+				else:
+					self.m_txtMain.Value = 'Not a valid text file'
+		elif os.path.isfile(filename):
 			if extension.lower() not in imgs:
 				self.curFileName = filename
 				contents = open(filename, 'r').read()
@@ -195,12 +368,60 @@ class MainFrame( gui.MainFrameBase ):
 		'''
 		Delete a selected file
 		'''
+		if self.job is not None:
+			return
 		# Grab the filename and make sure it is not an image
 		# If not an image, then load the file and display
 
 		if len(self.curFileName) > 0:
-			os.remove(self.curFileName)
+			if self.book.archive is not None:
+				self.book.archive.removeFile(self.curFileName)
+			else:
+				os.remove(self.curFileName)
+			self.refreshTree()
+		
+	def refreshTree(self):
+		'''
+		Show the files of the current book
+		'''
+		if self.book.archive is not None:
+			self.populateArchiveTree(self.book.archive, self.book.epubFileName)
+		else:
 			self.populateTree(self.book.baseEpubDir, self.book.epubFileName)
+	
+	def populateArchiveTree(self, archive, rootDisplay):
+		'''
+		Build the EPUB file structure tree from the names in the archive
+		'''
+		# Clear tree and prepare for data
+		self.m_treeFiles.DeleteAllItems()
+		rootEntry = self.m_treeFiles.AddRoot(rootDisplay)
+		self.m_treeFiles.SetPyData(rootEntry, Directory(''))
+		
+		# Sort out the folders and files; the folders are added first (so
+		# they come before the files, as with populateTree)
+		folders = set()
+		files = []
+		for name in archive.namelist():
+			parts = name.rstrip('/').split('/')
+			for i in xrange(1, len(parts)):
+				folders.add('/'.join(parts[:i]))
+			if name.endswith('/'):
+				folders.add(name.rstrip('/'))
+			else:
+				files.append(name)
+		
+		ids = {'' : rootEntry}
+		for folder in sorted(folders):
+			parent, dirname = posixpath.split(folder)
+			ids[folder] = self.m_treeFiles.AppendItem(ids[parent], dirname)
+			self.m_treeFiles.SetPyData(ids[folder], Directory(folder + '/'))
+		for name in sorted(files):
+			parent, filename = posixpath.split(name)
+			child = self.m_treeFiles.AppendItem(ids[parent], filename)
+			self.m_treeFiles.SetPyData(child, Directory(name))
+		
+		self.m_treeFiles.ExpandAll()
 		
 	def populateTree(self, root, rootDisplay):
 		'''
@@ -245,8 +466,14 @@ class MainFrame( gui.MainFrameBase ):
 		'''
 		Clean up all temp folders and then Exit
 		'''		
+		self.closing = True
 		try:
-			self.removeAllTempDirs()
+			# A job that has not stopped may still be using the temp folders,
+			# so they are left behind rather than removed from under it
+			if self.stopJob():
+				if hasattr(self, 'book') and self.book.archive is not None:
+					self.book.archive.close()
+				self.removeAllTempDirs()
 		finally:
 			self.Destroy()
 
@@ -255,6 +482,8 @@ class MainFrame( gui.MainFrameBase ):
 		Recursively remove files and folders
 		'''
 		for dir in self.tempdirs:
+			if not os.path.isdir(dir):
+				continue
 			for root, dirs, files in os.walk(dir, topdown=False):
 				for name in files:
 					os.remove(os.path.join(root, name))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+'''
+Copyright (c) 2011-2012 Doug Thompson
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be included
+in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+Headless batch conversion of HTML files into EPUB files
+
+Usage:
+    python batch.py [-w WORKERS] [-j PROCESSES] [-o OUTDIR] [-c PROFILE] [-d] [--date DATE]
+                    [--cache DIR [--cache-size MB]] <directory | manifest> ...
+
+A directory is searched (recursively with -r) for *.html files, while any
+other file is treated as a manifest listing one HTML file per line.
+'''
+
+import os
+import sys
+import time
+import logging
+import argparse
+import itertools
+import traceback
+import multiprocessing
+
+from EpubTools import EpubBook
+from EpubProgress import LogProgressSink
+from EpubZip import compressionProfiles
+from EpubCache import EpubCache
+
+# The templates in support/ are loaded relative to the application directory
+appDir = os.path.dirname(os.path.abspath(__file__))
+
+def findHtmlFiles(path, recursive):
+    '''
+    Get the list of HTML files from a directory or a manifest file
+    '''
+    fileList = []
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for fname in sorted(files):
+                if os.path.splitext(fname)[1].lower() in ('.html', '.htm'):
+                    fileList.append(os.path.join(root, fname))
+            if not recursive:
+                break
+            dirs.sort()
+    else:
+        # Manifest: one file per line, relative to the manifest location
+        baseDir = os.path.dirname(path)
+        with open(path, 'r') as manifest:
+            for line in manifest:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    fileList.append(os.path.join(baseDir, line))
+
+    return [os.path.abspath(fname) for fname in fileList]
+
+def initWorker(verbose):
+    '''
+    Make sure each worker process can find the support templates
+    '''
+    os.chdir(appDir)
+    if verbose:
+        logging.basicConfig(level=logging.DEBUG, format='%(process)d %(message)s')
+
+def convertBook(job):
+    '''
+    Convert a single HTML file, returning (source, epub, seconds, error,
+    cached)
+    '''
+    fileName, outDir, compression, deterministic, dateCreated, cacheDir, cacheSize, renderWorkers = job
+    start = time.time()
+    epubFile = ''
+    cached = False
+    try:
+        book = EpubBook(fileName, LogProgressSink())
+        book.compression = compressionProfiles[compression]
+        # Rendering is pure Python, so only processes help; the workers of
+        # a pool cannot start processes of their own
+        if renderWorkers > 1 and not multiprocessing.current_process().daemon:
+            book.renderWorkers = renderWorkers
+            book.renderProcesses = True
+        book.deterministic = deterministic
+        if dateCreated <> '':
+            book.dateCreated = dateCreated
+            book.dateFixed = True
+        book.parseFileName(fileName)
+
+        if outDir == '':
+            epubFile = os.path.join(os.path.dirname(fileName), book.epubFileName)
+        else:
+            epubFile = os.path.join(outDir, book.epubFileName)
+
+        cache = None
+        if cacheDir <> '':
+            cache = EpubCache(cacheDir, cacheSize)
+            key = book.getBuildKey(fileName)
+            cached = cache.fetch(key, epubFile)
+
+        if not cached:
+            # Write straight into the archive, no temp dir required
+            book.createEpub(fileName, epubFile)
+            if cache is not None:
+                cache.store(key, epubFile)
+        error = ''
+    except Exception:
+        error = traceback.format_exc()
+
+    return fileName, epubFile, time.time() - start, error, cached
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert HTML files into EPUB files without the GUI.')
+    parser.add_argument('sources', nargs='+', help='directories of HTML files or manifest files')
+    parser.add_argument('-o', '--outdir', default='', help='where to write the EPUB files (default: next to each HTML file)')
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(), help='number of worker processes')
+    parser.add_argument('-j', '--render-processes', type=int, default=1, help='number of processes rendering the chapters of each book (only with -w 1)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='search directories recursively')
+    parser.add_argument('-c', '--compression', choices=sorted(compressionProfiles), default='default', help='compression profile (default: default)')
+    parser.add_argument('-d', '--deterministic', action='store_true', help='build byte-for-byte repeatable EPUB files (needs --date or SOURCE_DATE_EPOCH)')
+    parser.add_argument('--date', default='', help='publication date (YYYY-MM-DD) to record instead of today')
+    parser.add_argument('--cache', default='', help='folder to keep built EPUB files in, so unchanged books are not built again')
+    parser.add_argument('--cache-size', type=int, default=1024, help='largest size of the cache in MB (default: 1024)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log the progress of each book')
+    args = parser.parse_args()
+
+    dateCreated = args.date
+    if args.deterministic and dateCreated == '':
+        if os.environ.get('SOURCE_DATE_EPOCH', '') == '':
+            parser.error('--deterministic needs --date or SOURCE_DATE_EPOCH')
+        dateCreated = time.strftime('%Y-%m-%d', time.gmtime(int(os.environ['SOURCE_DATE_EPOCH'])))
+
+    fileList = []
+    for source in args.sources:
+        fileList.extend(findHtmlFiles(source, args.recursive))
+
+    outDir = ''
+    if args.outdir <> '':
+        outDir = os.path.abspath(args.outdir)
+        if not os.path.isdir(outDir):
+            os.makedirs(outDir)
+
+    cacheDir = ''
+    if args.cache <> '':
+        cacheDir = os.path.abspath(args.cache)
+
+    jobs = [(fname, outDir, args.compression, args.deterministic, dateCreated, cacheDir, args.cache_size * 1024 * 1024, max(1, args.render_processes)) for fname in fileList]
+    failures = 0
+    hits = 0
+    start = time.time()
+
+    if args.workers <= 1:
+        # Build the books one at a time here, so each one can render its
+        # chapters across processes of its own (-j)
+        initWorker(args.verbose)
+        pool = None
+        results = itertools.imap(convertBook, jobs)
+    else:
+        pool = multiprocessing.Pool(args.workers, initWorker, (args.verbose,))
+        results = pool.imap_unordered(convertBook, jobs)
+    try:
+        for fileName, epubFile, seconds, error, cached in results:
+            if error == '' and cached:
+                hits += 1
+                print '{0:8.2f}s  {1} -> {2} (cached)'.format(seconds, os.path.basename(fileName), epubFile)
+            elif error == '':
+                print '{0:8.2f}s  {1} -> {2}'.format(seconds, os.path.basename(fileName), epubFile)
+            else:
+                failures += 1
+                print '{0:8.2f}s  FAILED {1}'.format(seconds, os.path.basename(fileName))
+                sys.stderr.write(error)
+        if pool is not None:
+            pool.close()
+    except KeyboardInterrupt:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        if pool is not None:
+            pool.join()
+
+    elapsed = time.time() - start
+    rate = 0
+    if elapsed > 0:
+        rate = len(jobs) / elapsed
+    print '{0} book(s), {1} failed, {2} cached, {3:.2f}s, {4:.2f} books/sec'.format(len(jobs), failures, hits, elapsed, rate)
+
+    if failures > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
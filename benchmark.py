@@ -0,0 +1,545 @@
+#!/usr/bin/env python
+'''
+Copyright (c) 2011-2012 Doug Thompson
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the
+"Software"), to deal in the Software without restriction, including
+without limitation the rights to use, copy, modify, merge, publish,
+distribute, sublicense, and/or sell copies of the Software, and to
+permit persons to whom the Software is furnished to do so, subject to
+the following conditions:
+
+The above copyright notice and this permission notice shall be included
+in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+'''
+
+'''
+Benchmarks for the EPUB processing code
+
+Usage:
+    python benchmark.py [--corpus DIR] [name ...]
+
+Run without any names to run every benchmark.  Benchmarks that work on
+whole books use the EPUB files in the corpus folder when one is given, and
+a synthetic book otherwise.
+'''
+
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import tempfile
+import argparse
+import multiprocessing
+
+import unzip
+import xmlpp
+import EpubZip
+import EpubLibrary
+
+from EpubTools import EpubBook
+from EpubTools import EpubProcessor
+from EpubTools import supportDir
+
+benchmarks = []
+
+# Folder of EPUB files to use instead of synthetic books (--corpus)
+corpusDir = ''
+
+def benchmark(func):
+    '''
+    Register a benchmark function
+    '''
+    benchmarks.append(func)
+    return func
+
+def timeIt(func, *args):
+    '''
+    Get the time taken (in seconds) to run a function
+    '''
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+def makeHeadingDocument(path, headings):
+    '''
+    Write a synthetic HTML file with the given number of h1/h2/h3 headings
+    '''
+    levels = [1, 2, 3, 3, 2, 3, 3, 3]
+    with open(path, 'w') as f:
+        f.write('<html>\n<body>\n')
+        for i in xrange(headings):
+            level = levels[i % len(levels)]
+            f.write('<h{0}>Section {1} - Heading {1}</h{0}>\n'.format(level, i))
+            f.write('<p>Some text for section {0}.</p>\n'.format(i))
+        f.write('</body>\n</html>\n')
+
+def makeEpubDir(path, files, size):
+    '''
+    Write a synthetic EPUB folder with the given number of text files
+    '''
+    os.makedirs(os.path.join(path, 'OPS'))
+    shutil.copy(os.path.join(supportDir, 'mimetype'), path)
+    rnd = random.Random(1)
+    words = ['the', 'quick', 'brown', 'fox', 'jumps', 'over', 'lazy', 'dog']
+    for i in xrange(files):
+        with open(os.path.join(path, 'OPS', 'file{0}.xml'.format(i)), 'w') as f:
+            written = 0
+            while written < size:
+                line = ' '.join(rnd.choice(words) for j in xrange(12)) + '\n'
+                f.write(line)
+                written += len(line)
+
+@benchmark
+def archive():
+    '''
+    Saving should scale with the number of threads compressing the files
+    '''
+    workDir = tempfile.mkdtemp()
+    try:
+        epubDir = os.path.join(workDir, 'book')
+        makeEpubDir(epubDir, 40, 1024 * 1024)
+        epubFile = os.path.join(workDir, 'book.epub')
+        print '{0:>10} {1:>10}'.format('workers', 'seconds')
+        for workers in sorted(set([1, 2, multiprocessing.cpu_count()])):
+            # Remove the last archive so nothing is reused from it
+            if os.path.isfile(epubFile):
+                os.remove(epubFile)
+            seconds = timeIt(EpubProcessor.createArchive, epubDir, epubFile, None, workers)
+            print '{0:>10} {1:>10.3f}'.format(workers, seconds)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+def makeImages(path, images, size):
+    '''
+    Add images to a synthetic EPUB folder (random data compresses about
+    as well as JPEG data does)
+    '''
+    imagesDir = os.path.join(path, 'OPS', 'images')
+    os.makedirs(imagesDir)
+    for i in xrange(images):
+        with open(os.path.join(imagesDir, 'image{0}.jpg'.format(i)), 'wb') as f:
+            f.write(os.urandom(size))
+
+def getCorpus(workDir):
+    '''
+    Get the (name, folder) of each book to benchmark, extracting the
+    corpus EPUB files (or making a synthetic book) under workDir
+    '''
+    books = []
+    if corpusDir <> '':
+        for fname in sorted(os.listdir(corpusDir)):
+            if os.path.splitext(fname)[1].lower() == '.epub':
+                bookDir = os.path.join(workDir, 'book{0}'.format(len(books)))
+                unzip.unzip().extract(os.path.join(corpusDir, fname), bookDir)
+                books.append((fname, bookDir))
+    else:
+        bookDir = os.path.join(workDir, 'book')
+        makeEpubDir(bookDir, 20, 256 * 1024)
+        makeImages(bookDir, 20, 512 * 1024)
+        books.append(('synthetic', bookDir))
+    return books
+
+@benchmark
+def compression():
+    '''
+    Bytes and time saved by each compression profile, against deflating everything
+    '''
+    workDir = tempfile.mkdtemp()
+    try:
+        books = getCorpus(workDir)
+        policies = [('deflate all', EpubZip.CompressionPolicy(storeCompressed=False))]
+        for name in sorted(EpubZip.compressionProfiles):
+            policies.append((name, EpubZip.compressionProfiles[name]))
+
+        epubFile = os.path.join(workDir, 'book.epub')
+        results = []
+        for name, policy in policies:
+            size = 0
+            seconds = 0
+            for bookName, bookDir in books:
+                # Remove the last archive so nothing is reused from it
+                if os.path.isfile(epubFile):
+                    os.remove(epubFile)
+                seconds += timeIt(EpubProcessor.createArchive, bookDir, epubFile, None, 1, policy)
+                size += os.path.getsize(epubFile)
+            results.append((name, size, seconds))
+
+        print '{0} book(s)'.format(len(books))
+        print '{0:>12} {1:>12} {2:>10} {3:>12} {4:>10}'.format('profile', 'bytes', 'seconds', 'bytes saved', 'time saved')
+        baseName, baseSize, baseSeconds = results[0]
+        for name, size, seconds in results:
+            print '{0:>12} {1:>12} {2:>10.3f} {3:>12} {4:>10.3f}'.format(name, size, seconds, baseSize - size, baseSeconds - seconds)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+@benchmark
+def headings():
+    '''
+    Chapter hierarchy construction should scale linearly with the headings
+    '''
+    workDir = tempfile.mkdtemp()
+    try:
+        print '{0:>10} {1:>10} {2:>14}'.format('headings', 'seconds', 'usec/heading')
+        for count in (10000, 20000, 40000, 80000):
+            path = os.path.join(workDir, 'headings.html')
+            makeHeadingDocument(path, count)
+            seconds = timeIt(EpubProcessor.parseHtml, path)
+            print '{0:>10} {1:>10.3f} {2:>14.2f}'.format(count, seconds, seconds * 1000000 / count)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+def makeEpubFile(workDir, headings):
+    '''
+    Build a synthetic EPUB file with the given number of headings
+    '''
+    path = os.path.join(workDir, 'Title - LastName, FirstName - Publisher - 2012 - Fiction.html')
+    makeHeadingDocument(path, headings)
+    book = EpubBook(path)
+    book.parseFileName(path)
+    epubFile = os.path.join(workDir, book.epubFileName)
+    book.createEpub(path, epubFile)
+    return epubFile
+
+def extractDetails(epubFile):
+    # What cataloguing a book used to take: extract it all, then read the OPF
+    book = EpubBook(epubFile)
+    book.parseEpub(epubFile)
+    EpubProcessor.getEpubDetails(book)
+    shutil.rmtree(book.baseDir, ignore_errors=True)
+
+@benchmark
+def metadata():
+    '''
+    Reading only the OPF should be much faster than extracting each book
+    '''
+    workDir = tempfile.mkdtemp()
+    try:
+        books = os.path.join(workDir, 'books')
+        os.makedirs(books)
+        epubFile = makeEpubFile(workDir, 200)
+        for i in xrange(200):
+            shutil.copy(epubFile, os.path.join(books, 'book{0}.epub'.format(i)))
+        fileNames = sorted(EpubProcessor.findEpubFiles(books))
+
+        print '{0:>24} {1:>10} {2:>10}'.format('method', 'seconds', 'books/sec')
+        methods = [('extract + details', lambda: [extractDetails(fname) for fname in fileNames[:20]], 20),
+                   ('readEpubMetadata', lambda: [EpubProcessor.readEpubMetadata(fname) for fname in fileNames], len(fileNames)),
+                   ('scanEpubs', lambda: list(EpubProcessor.scanEpubs(books)), len(fileNames))]
+        for name, func, count in methods:
+            seconds = timeIt(func)
+            print '{0:>24} {1:>10.3f} {2:>10.1f}'.format(name, seconds, count / seconds)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+@benchmark
+def library():
+    '''
+    Adding books to a large library should not depend on rewriting it per book
+    '''
+    workDir = tempfile.mkdtemp()
+    try:
+        book = EpubProcessor.readEpubMetadata(makeEpubFile(workDir, 10))
+        libraryFile = os.path.join(workDir, 'library.atom')
+        library = EpubLibrary.EpubLibrary(libraryFile)
+        rnd = random.Random(1)
+        for i in xrange(50000):
+            entry = EpubLibrary.makeEntry(book)
+            entry['creator'] = 'Author {0}'.format(rnd.randint(0, 5000))
+            entry['authorHash'] = EpubLibrary.getShortHash(entry['creator'])
+            entry['title'] = 'Title {0}'.format(i)
+            library.add(entry)
+        library.save()
+
+        def addBooks(count):
+            library = EpubLibrary.EpubLibrary(libraryFile)
+            for i in xrange(count):
+                book.creator = 'Author {0}'.format(rnd.randint(0, 5000))
+                book.title = 'New Title {0}'.format(i)
+                library.addBook(book)
+            library.save()
+            return library.written
+
+        print '{0:>10} {1:>10} {2:>10} {3:>14}'.format('entries', 'added', 'seconds', 'files written')
+        for count in (1, 1000):
+            entries = len(EpubLibrary.EpubLibrary(libraryFile))
+            start = time.time()
+            written = addBooks(count)
+            print '{0:>10} {1:>10} {2:>10.3f} {3:>14}'.format(entries, count, time.time() - start, written)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+# The xmlpp pretty printer before it was rewritten to work in a single pass
+# (Copyright (c) 2008, Fredrik Ekholdt; see xmlpp.py for the licence), kept
+# to check the new one gives the same output and to time it against
+
+def legacyPprintLine(indent_level, line, wasContent, width=100, output=sys.stdout, inline=True):
+    if line.strip():
+        start = ""
+        number_chars = 0
+        
+        spacer = " "
+
+        if wasContent & inline:
+            spacer = ""
+        elif wasContent == False & inline == False:
+            output.write("\n")
+
+        for l in range(indent_level):
+            start = start + spacer
+            number_chars = number_chars + 1
+            
+        try:
+            elem_start = re.findall("(\<\W{0,1}\w+:\w+) ?", line)[0]
+            elem_finished = re.findall("([?|\]\]/]*\>)", line)[0]
+            #should not have *
+            attrs = re.findall("(\S*?\=\".*?\")", line)
+            output.write(start + elem_start)
+            number_chars = len(start + elem_start)
+            for attr in attrs:
+                if (attrs.index(attr) + 1) == len(attrs):
+                    number_chars = number_chars + len(elem_finished)
+                if (number_chars + len(attr) + 1) > width:
+                    #output.write("\n")
+                    for i in range(len(start + elem_start) + 1):
+                        output.write(" ")
+                    number_chars = len(start + elem_start) + 1 
+                else:
+                    output.write(" ")
+                    number_chars = number_chars + 1
+                output.write(attr)
+                number_chars = number_chars + len(attr)
+            #output.write(elem_finished + "#\n")
+            output.write(elem_finished)
+        except IndexError:
+            #give up pretty print this line
+            #output.write(start + line + "$\n")
+            output.write(start + line)
+                
+
+def legacyPprintElemContent(indent_level, line, output=sys.stdout, inline=True):
+    if line.strip():
+        spacer = " "
+        
+        if inline:
+            spacer = ""
+        else:
+            output.write("\n")
+
+        for l in range(indent_level):
+            output.write(spacer)
+            
+        if inline:
+            output.write(line)
+        else:
+            output.write(line + "\n")
+        return True
+        
+    return False
+    
+def legacyGetNextElem(data):
+    start_pos = data.find("<")
+    end_pos = data.find(">") + 1
+    retval = data[start_pos:end_pos]
+    stopper = retval.rfind("/") 
+    if stopper < retval.rfind("\""):
+        stopper = -1
+    single = (stopper > -1 and ((retval.find(">") - stopper) < (stopper - retval.find("<"))))
+
+    ignore_excl = retval.find("<!") > -1
+    ignore_question =  retval.find("<?") > -1
+
+    if ignore_excl:
+        cdata = retval.find("<![CDATA[") > -1
+        if cdata:
+            end_pos = data.find("]]>")
+            if end_pos > -1:
+                end_pos = end_pos + len("]]>")
+
+    elif ignore_question:
+        end_pos = data.find("?>") + len("?>")
+    ignore = ignore_excl or ignore_question
+    
+    no_indent = ignore or single
+
+    #print retval, end_pos, start_pos, stopper > -1, no_indent
+    return start_pos, \
+           end_pos, \
+           stopper > -1, \
+           no_indent
+
+def legacyPprint(xml, output=sys.stdout, indent=4, width=80, inline=True):
+    """Pretty print xml. 
+    Use output to select output stream. Default is sys.stdout
+    Use indent to select indentation level. Default is 4   """
+    data = xml
+    indent_level = 0
+    start_pos, end_pos, is_stop, no_indent  = legacyGetNextElem(data)
+    while ((start_pos > -1 and end_pos > -1)):
+        wasContent = legacyPprintElemContent(indent_level,
+                                          data[:start_pos].strip(),
+                                          output=output,
+                                          inline=inline)
+        data = data[start_pos:]
+        
+        if is_stop and not no_indent:
+            indent_level = indent_level - indent
+        
+        legacyPprintLine(indent_level, 
+                     data[:end_pos - start_pos],
+                     wasContent,
+                     width=width,
+                     output=output,
+                     inline=inline)
+        data = data[end_pos - start_pos:]
+        if not is_stop and not no_indent :
+            indent_level = indent_level + indent
+
+        if not data:
+            break
+        else:
+            start_pos, end_pos, is_stop, no_indent  = legacyGetNextElem(data)
+    
+
+def legacyGetPprint(xml, indent=4, width=80, inline=True):
+    """Returns the pretty printed xml """
+    class out:
+        output = ""
+
+        def write(self, string): 
+            self.output += string
+    out = out()
+    legacyPprint(xml, output=out, indent=indent, width=width, inline=inline)
+
+    while (out.output[:1] == '\n') & (len(out.output) > 0):
+        out.output = out.output[1:]
+        
+    return out.output
+
+def makeXhtmlDocument(paragraphs):
+    '''
+    Get a synthetic XHTML document with the given number of paragraphs
+    '''
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">\n<body>\n']
+    for i in xrange(paragraphs):
+        parts.append('<div class="text"><p>Paragraph {0} with <em>some</em> text.</p><dc:meta name="n{0}" content="v"/></div>\n'.format(i))
+    parts.append('</body>\n</html>\n')
+    return ''.join(parts)
+
+@benchmark
+def prettyprint():
+    '''
+    Pretty printing should scale linearly with the size of the document
+    '''
+    print '{0:>10} {1:>10} {2:>10} {3:>10}'.format('bytes', 'legacy', 'seconds', 'same')
+    for paragraphs in (1000, 4000, 16000):
+        document = makeXhtmlDocument(paragraphs)
+        start = time.time()
+        output = xmlpp.get_pprint(document)
+        seconds = time.time() - start
+
+        # The old version copies the rest of the document for each element,
+        # so only time it on the smaller documents
+        legacy = '-'
+        same = '-'
+        if paragraphs <= 4000:
+            start = time.time()
+            legacyOutput = legacyGetPprint(document)
+            legacy = '{0:.3f}'.format(time.time() - start)
+            same = str(output == legacyOutput)
+        print '{0:>10} {1:>10} {2:>10.3f} {3:>10}'.format(len(document), legacy, seconds, same)
+
+# The text helpers as they were before their patterns were compiled once
+def legacyStripTags(inputText):
+    cleaned = re.compile(r'<[^<]*?/?>')
+    return cleaned.sub('', inputText)
+
+def legacyStripSingleTag(inputText, tag):
+    cleaned = re.compile(r'<[/]?(' + tag + r'|[' + tag + r']:\w+)[^>]*?>')
+    return cleaned.sub('', inputText)
+
+def makeHtmlLines(count):
+    '''
+    Get synthetic lines of HTML with a mix of headings, paragraphs and tags
+    '''
+    lines = []
+    for i in xrange(count):
+        if i % 10 == 0:
+            lines.append('<h2 class="chapter">Chapter {0} - The <em>Title</em> {0}</h2>'.format(i))
+        else:
+            lines.append('<p>Line {0} with <span class="x">some</span> <b>bold</b> and <a href="#n{0}">a link</a>.</p>'.format(i))
+    return lines
+
+@benchmark
+def texthelpers():
+    '''
+    The EpubProcessor text helpers should not recompile their patterns
+    '''
+    lines = makeHtmlLines(20000)
+    tags = ['span', 'b', 'a', 'em', 'p']
+    exceptions = ['a', 'an', 'the', 'of', 'and']
+
+    def loop(func, *args):
+        for line in lines:
+            func(line, *args)
+
+    def loopTags(func):
+        for i, line in enumerate(lines):
+            func(line, tags[i % len(tags)])
+
+    cases = [
+        ('stripTags', lambda: loop(legacyStripTags), lambda: loop(EpubProcessor.stripTags)),
+        ('stripSingleTag', lambda: loopTags(legacyStripSingleTag), lambda: loopTags(EpubProcessor.stripSingleTag)),
+        ('stripTagsMany', lambda: loop(legacyStripTags), lambda: EpubProcessor.stripTagsMany(lines)),
+        ('splitChapterLine', None, lambda: loop(EpubProcessor.splitChapterLine)),
+        ('toTitleCase', None, lambda: loop(EpubProcessor.toTitleCase, exceptions)),
+    ]
+
+    # Both versions must give the same results
+    for i, line in enumerate(lines):
+        tag = tags[i % len(tags)]
+        assert legacyStripTags(line) == EpubProcessor.stripTags(line)
+        assert legacyStripSingleTag(line, tag) == EpubProcessor.stripSingleTag(line, tag)
+    assert [legacyStripTags(line) for line in lines] == EpubProcessor.stripTagsMany(lines)
+
+    print '{0:>18} {1:>10} {2:>14} {3:>14}'.format('helper', 'lines', 'legacy usec', 'usec/line')
+    for name, legacy, current in cases:
+        legacyTime = '-'
+        if legacy is not None:
+            legacyTime = '{0:.2f}'.format(timeIt(legacy) * 1000000 / len(lines))
+        seconds = timeIt(current)
+        print '{0:>18} {1:>10} {2:>14} {3:>14.2f}'.format(name, len(lines), legacyTime, seconds * 1000000 / len(lines))
+
+def main():
+    names = [func.__name__ for func in benchmarks]
+    parser = argparse.ArgumentParser(description='Run the EPUB Studio benchmarks.')
+    parser.add_argument('names', nargs='*', help='benchmarks to run: ' + ', '.join(names) + ' (default: all)')
+    parser.add_argument('--corpus', default='', help='folder of EPUB files to use instead of synthetic books')
+    args = parser.parse_args()
+
+    global corpusDir
+    corpusDir = args.corpus
+
+    for name in args.names:
+        if name not in names:
+            parser.error('unknown benchmark: ' + name)
+
+    for func in benchmarks:
+        if len(args.names) == 0 or func.__name__ in args.names:
+            print '== {0}: {1}'.format(func.__name__, func.__doc__.strip())
+            func()
+            print
+
+if __name__ == '__main__':
+    main()
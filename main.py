@@ -23,6 +23,7 @@ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 '''
 
 import wx
+import multiprocessing
 from MainFrame import MainFrame
 
 global tempdirs
@@ -38,5 +39,9 @@ class EpubStudio(wx.App):
         
         return True
         
-app = EpubStudio(0)
-app.MainLoop()
+if __name__ == '__main__':
+    # Worker processes on Windows import this module again (and frozen
+    # builds run it again), so only start the application once
+    multiprocessing.freeze_support()
+    app = EpubStudio(0)
+    app.MainLoop()
@@ -22,69 +22,123 @@ import zipfile
 import os
 import os.path
 import getopt
+import shutil
+import threading
+import multiprocessing.pool
 
 class unzip:
-    def __init__(self, verbose = False, percent = 10):
+    def __init__(self, verbose = False, percent = 10, threads = 1, progress = None):
         self.verbose = verbose
         self.percent = percent
+        self.threads = threads
+        self.chunksize = 64 * 1024
+        # called as progress(name, count, total) after each file is written
+        self.progress = progress
         
     def extract(self, file, dir):
         if not dir.endswith(':') and not os.path.exists(dir):
             os.makedirs(dir)
 
         zf = zipfile.ZipFile(file)
-
-        # create directory structure to house files
-        self._createstructure(file, dir)
-
-        num_files = len(zf.namelist())
-        percent = self.percent
-        divisions = 100 / percent
-        perc = int(num_files / divisions)
-
-        # extract files to directory structure
-        for i, name in enumerate(zf.namelist()):
-            curDir = os.path.dirname(name)
-            if len(curDir) > 0:
-                if not os.path.exists(os.path.join(dir, curDir)):
-                    os.makedirs(os.path.join(dir, curDir))
-            
-            if self.verbose == True:
-                print "Extracting %s" % name
-            elif perc > 0 and (i % perc) == 0 and i > 0:
-                complete = int (i / perc) * percent
-                print "%s%% complete" % complete
-
-            if not (name.endswith('/') or name.endswith('\\')):
-                outfile = open(os.path.join(dir, name), 'wb')
-                outfile.write(zf.read(name))
-                outfile.flush()
+        try:
+            infos = zf.infolist()
+
+            # create directory structure to house files
+            self._makedirs(self._listdirs(infos), dir)
+
+            files = [info for info in infos if not (info.filename.endswith('/') or info.filename.endswith('\\'))]
+            total = len(files)
+
+            # extract files to directory structure
+            if self.threads > 1 and total > 1:
+                self._extractparallel(file, files, dir, total)
+            else:
+                for i, info in enumerate(files):
+                    self._extractmember(zf, info, dir)
+                    self._report(info.filename, i + 1, total)
+        finally:
+            zf.close()
+
+    def _extractparallel(self, file, files, dir, total):
+        """ Write the files across a pool of threads, each with its own
+        handle on the zip file (a ZipFile cannot be read by two threads
+        at once) """
+        local = threading.local()
+        handles = []
+        lock = threading.Lock()
+
+        def extractone(info):
+            if not hasattr(local, 'zf'):
+                local.zf = zipfile.ZipFile(file)
+                with lock:
+                    handles.append(local.zf)
+            self._extractmember(local.zf, info, dir)
+            return info.filename
+
+        pool = multiprocessing.pool.ThreadPool(self.threads)
+        try:
+            for i, name in enumerate(pool.imap_unordered(extractone, files)):
+                self._report(name, i + 1, total)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            for zf in handles:
+                zf.close()
+
+    def _extractmember(self, zf, info, dir):
+        """ Stream a file out in chunks rather than reading it all in """
+        src = zf.open(info)
+        try:
+            outfile = open(os.path.join(dir, info.filename), 'wb')
+            try:
+                shutil.copyfileobj(src, outfile, self.chunksize)
+            finally:
                 outfile.close()
+        finally:
+            src.close()
 
-    def _createstructure(self, file, dir):
-        self._makedirs(self._listdirs(file), dir)
+    def _report(self, name, count, total):
+        if self.progress is not None:
+            self.progress(name, count, total)
 
     def _makedirs(self, directories, basedir):
         """ Create any directories that don't currently exist """
         for dir in directories:
             curdir = os.path.join(basedir, dir)
-            if not os.path.exists(curdir):
-                os.mkdir(curdir)
-
-    def _listdirs(self, file):
-        """ Grabs all the directories in the zip structure
-        This is necessary to create the structure before trying
-        to extract the file to it. """
-        zf = zipfile.ZipFile(file)
-
-        dirs = []
-
-        for name in zf.namelist():
-            if name.endswith('/'):
-                dirs.append(name)
-
-        dirs.sort()
-        return dirs
+            if not os.path.isdir(curdir):
+                os.makedirs(curdir)
+
+    def _listdirs(self, infos):
+        """ Grabs all the directories in the zip structure (including
+        those only implied by a file name), so each one is created just
+        once before trying to extract the files to it. """
+        dirs = set()
+
+        for info in infos:
+            name = info.filename.replace('\\', '/')
+            if not name.endswith('/'):
+                name = os.path.dirname(name)
+            name = name.rstrip('/')
+            while name != '' and name not in dirs:
+                dirs.add(name)
+                name = os.path.dirname(name)
+
+        return sorted(dirs)
+
+def printprogress(unzipper):
+    """ Report progress the way the command line always has """
+    def report(name, count, total):
+        if unzipper.verbose == True:
+            print "Extracted %s" % name
+        else:
+            perc = int(total / (100 / unzipper.percent))
+            if perc > 0 and (count % perc) == 0 and count < total:
+                complete = int(count / perc) * unzipper.percent
+                print "%s%% complete" % complete
+    return report
 
 def usage():
     print """usage: unzip.py -z <zipfile> -o <targetdir>
@@ -95,19 +149,22 @@ def usage():
     -o target location
     -p sets the percentage notification
     -v sets the extraction to verbose (overrides -p)
+    -t number of threads writing files (default 1)
 
     long options also work:
     --verbose
     --percent=10
+    --threads=1
     --zipfile=<zipfile>
     --outdir=<targetdir>"""
     
 
 def main():
-    shortargs = 'vhp:z:o:'
-    longargs = ['verbose', 'help', 'percent=', 'zipfile=', 'outdir=']
+    shortargs = 'vhp:t:z:o:'
+    longargs = ['verbose', 'help', 'percent=', 'threads=', 'zipfile=', 'outdir=']
 
     unzipper = unzip()
+    unzipper.progress = printprogress(unzipper)
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], shortargs, longargs)
@@ -124,6 +181,8 @@ def main():
         if o in ("-p", "--percent"):
             if not unzipper.verbose == True:
                 unzipper.percent = int(a)
+        if o in ("-t", "--threads"):
+            unzipper.threads = int(a)
         if o in ("-z", "--zipfile"):
             zipsource = a
         if o in ("-o", "--outdir"):
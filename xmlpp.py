@@ -33,79 +33,89 @@ POSSIBILITY OF SUCH DAMAGE."""
 import sys as _sys
 import re as _re
 
+# Compiled once; used to lay out the attributes of namespaced elements
+_elem_start_re = _re.compile("(\<\W{0,1}\w+:\w+) ?")
+_elem_finished_re = _re.compile("([?|\]\]/]*\>)")
+_attr_re = _re.compile("(\S*?\=\".*?\")")
+
 def _usage(this_file):
     return """SYNOPSIS: pretty print an XML document
 USAGE: python %s <filename> \n""" % this_file
 
+# How much to read at a time when streaming
+_READ_SIZE = 65536
+
 def _pprint_line(indent_level, line, wasContent, width=100, output=_sys.stdout, inline=True):
     if line.strip():
-        start = ""
-        number_chars = 0
-        
         spacer = " "
 
-        if wasContent & inline:
+        if wasContent and inline:
             spacer = ""
-        elif wasContent == False & inline == False:
+        elif not wasContent:
             output.write("\n")
 
-        for l in range(indent_level):
-            start = start + spacer
-            number_chars = number_chars + 1
-            
-        try:
-            elem_start = _re.findall("(\<\W{0,1}\w+:\w+) ?", line)[0]
-            elem_finished = _re.findall("([?|\]\]/]*\>)", line)[0]
-            #should not have *
-            attrs = _re.findall("(\S*?\=\".*?\")", line)
-            output.write(start + elem_start)
-            number_chars = len(start + elem_start)
-            for attr in attrs:
-                if (attrs.index(attr) + 1) == len(attrs):
-                    number_chars = number_chars + len(elem_finished)
-                if (number_chars + len(attr) + 1) > width:
-                    #output.write("\n")
-                    for i in range(len(start + elem_start) + 1):
-                        output.write(" ")
-                    number_chars = len(start + elem_start) + 1 
-                else:
-                    output.write(" ")
-                    number_chars = number_chars + 1
-                output.write(attr)
-                number_chars = number_chars + len(attr)
-            #output.write(elem_finished + "#\n")
-            output.write(elem_finished)
-        except IndexError:
+        start = spacer * indent_level
+
+        elem_start = _elem_start_re.search(line)
+        elem_finished = _elem_finished_re.search(line)
+        if elem_start is None or elem_finished is None:
             #give up pretty print this line
-            #output.write(start + line + "$\n")
             output.write(start + line)
-                
+            return
+
+        elem_start = elem_start.group(1)
+        elem_finished = elem_finished.group(1)
+        #should not have *
+        attrs = _attr_re.findall(line)
+        output.write(start + elem_start)
+        number_chars = len(start + elem_start)
+        last = len(attrs) - 1
+        for i, attr in enumerate(attrs):
+            # Only a last attribute that is not repeated earlier counts
+            if i == last and attrs.index(attr) == i:
+                number_chars = number_chars + len(elem_finished)
+            if (number_chars + len(attr) + 1) > width:
+                output.write(" " * (len(start + elem_start) + 1))
+                number_chars = len(start + elem_start) + 1
+            else:
+                output.write(" ")
+                number_chars = number_chars + 1
+            output.write(attr)
+            number_chars = number_chars + len(attr)
+        output.write(elem_finished)
 
 def _pprint_elem_content(indent_level, line, output=_sys.stdout, inline=True):
     if line.strip():
-        spacer = " "
-        
-        if inline:
-            spacer = ""
-        else:
-            output.write("\n")
-
-        for l in range(indent_level):
-            output.write(spacer)
-            
         if inline:
             output.write(line)
         else:
-            output.write(line + "\n")
+            output.write("\n" + " " * indent_level + line + "\n")
         return True
-        
+
     return False
-    
-def _get_next_elem(data):
-    start_pos = data.find("<")
-    end_pos = data.find(">") + 1
-    retval = data[start_pos:end_pos]
-    stopper = retval.rfind("/") 
+
+def _slice(xml, pos, start, stop):
+    """xml[pos:][start:stop] without copying the rest of the document"""
+    if start is None:
+        start = 0
+    if start < 0 or stop < 0:
+        start, stop, step = slice(start, stop).indices(len(xml) - pos)
+    return xml[pos + start:pos + stop]
+
+def _get_next_elem(xml, pos):
+    """Find the next element in xml[pos:], returning its start and end
+    (relative to pos), whether it closes an element, whether it leaves
+    the indent alone and whether everything searched for was found"""
+    start_pos = xml.find("<", pos)
+    if start_pos > -1:
+        start_pos = start_pos - pos
+    end_pos = xml.find(">", pos)
+    if end_pos > -1:
+        end_pos = end_pos - pos
+    found = start_pos > -1 and end_pos > -1
+    end_pos = end_pos + 1
+    retval = _slice(xml, pos, start_pos, end_pos)
+    stopper = retval.rfind("/")
     if stopper < retval.rfind("\""):
         stopper = -1
     single = (stopper > -1 and ((retval.find(">") - stopper) < (stopper - retval.find("<"))))
@@ -116,69 +126,129 @@ def _get_next_elem(data):
     if ignore_excl:
         cdata = retval.find("<![CDATA[") > -1
         if cdata:
-            end_pos = data.find("]]>")
+            end_pos = xml.find("]]>", pos)
+            found = found and end_pos > -1
             if end_pos > -1:
-                end_pos = end_pos + len("]]>")
+                end_pos = end_pos - pos + len("]]>")
 
     elif ignore_question:
-        end_pos = data.find("?>") + len("?>")
+        end_pos = xml.find("?>", pos)
+        found = found and end_pos > -1
+        if end_pos > -1:
+            end_pos = end_pos - pos
+        end_pos = end_pos + len("?>")
     ignore = ignore_excl or ignore_question
-    
+
     no_indent = ignore or single
 
-    #print retval, end_pos, start_pos, stopper > -1, no_indent
     return start_pos, \
            end_pos, \
            stopper > -1, \
-           no_indent
+           no_indent, \
+           found
 
 def pprint(xml, output=_sys.stdout, indent=4, width=80, inline=True):
     """Pretty print xml. 
     Use output to select output stream. Default is sys.stdout
     Use indent to select indentation level. Default is 4   """
-    data = xml
+    pprint_stream([xml], output=output, indent=indent, width=width, inline=inline)
+
+def read_chunks(fh, size=_READ_SIZE):
+    """Read a file (or zip member) as an iterable of chunks for pprint_stream"""
+    return iter(lambda: fh.read(size), "")
+
+def pprint_stream(chunks, output=_sys.stdout, indent=4, width=80, inline=True):
+    """Pretty print xml read from an iterable of strings, such as
+    read_chunks(fh), writing the output as it goes.
+    Only the document around the current element is kept in memory, and
+    the output is the same as pprint gives for the whole document."""
+    # Works along the document by position in a single pass, rather than
+    # slicing off (and copying) the rest of the document for each element
+    chunks = iter(chunks)
+    xml = ""
+    pos = 0
+    more = True
     indent_level = 0
-    start_pos, end_pos, is_stop, no_indent  = _get_next_elem(data)
-    while ((start_pos > -1 and end_pos > -1)):
+    while True:
+        start_pos, end_pos, is_stop, no_indent, found = _get_next_elem(xml, pos)
+
+        # Read on until the element is complete (a ">" before the "<" needs
+        # the rest of the document) or there is nothing left to read.  Each
+        # read at least doubles what is kept, so the copying stays linear.
+        if more and (not found or end_pos < start_pos):
+            pending = []
+            size = 0
+            while size < max(len(xml) - pos, _READ_SIZE):
+                chunk = next(chunks, None)
+                if chunk is None:
+                    more = False
+                    break
+                pending.append(chunk)
+                size = size + len(chunk)
+            xml = xml[pos:] + "".join(pending)
+            pos = 0
+            continue
+
+        if not (start_pos > -1 and end_pos > -1):
+            break
+
+        last_pos = pos
         wasContent = _pprint_elem_content(indent_level,
-                                          data[:start_pos].strip(),
+                                          xml[pos:pos + start_pos].strip(),
                                           output=output,
                                           inline=inline)
-        data = data[start_pos:]
+        pos = pos + start_pos
         
         if is_stop and not no_indent:
             indent_level = indent_level - indent
         
         _pprint_line(indent_level, 
-                     data[:end_pos - start_pos],
+                     _slice(xml, pos, None, end_pos - start_pos),
                      wasContent,
                      width=width,
                      output=output,
                      inline=inline)
-        data = data[end_pos - start_pos:]
+        if end_pos >= start_pos:
+            pos = min(pos + end_pos - start_pos, len(xml))
+        else:
+            pos = pos + slice(end_pos - start_pos, None).indices(len(xml) - pos)[0]
         if not is_stop and not no_indent :
             indent_level = indent_level + indent
 
-        if not data:
+        # A "<" without a ">" after it never moves on, so stop there
+        if (pos >= len(xml) and not more) or pos == last_pos:
             break
-        else:
-            start_pos, end_pos, is_stop, no_indent  = _get_next_elem(data)
     
 
+class _ListWriter:
+    """Collect the pieces written, to be joined once at the end"""
+    def __init__(self):
+        self.parts = []
+        self.write = self.parts.append
+
 def get_pprint(xml, indent=4, width=80, inline=True):
     """Returns the pretty printed xml """
-    class out:
-        output = ""
-
-        def write(self, string): 
-            self.output += string
-    out = out()
+    out = _ListWriter()
     pprint(xml, output=out, indent=indent, width=width, inline=inline)
+    return "".join(out.parts).lstrip("\n")
 
-    while (out.output[:1] == '\n') & (len(out.output) > 0):
-        out.output = out.output[1:]
-        
-    return out.output
+class _LstripWriter:
+    """Drop the newlines written before anything else, as get_pprint does"""
+    def __init__(self, output):
+        self.output = output
+        self.started = False
+
+    def write(self, string):
+        if not self.started:
+            string = string.lstrip("\n")
+            self.started = len(string) > 0
+        if string:
+            self.output.write(string)
+
+def write_pprint(chunks, output, indent=4, width=80, inline=True):
+    """Write what get_pprint would return for the xml read from an
+    iterable of strings to output, without holding either in memory"""
+    pprint_stream(chunks, output=_LstripWriter(output), indent=indent, width=width, inline=inline)
 
 
 if __name__ == "__main__":
@@ -192,4 +262,4 @@ if __name__ == "__main__":
         filename = _sys.argv[1]
         fh = open(filename)
 
-    pprint(fh.read(), output=_sys.stdout, indent=4, width=80)
+    pprint_stream(read_chunks(fh), output=_sys.stdout, indent=4, width=80)